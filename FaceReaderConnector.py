@@ -1,65 +1,83 @@
 import socket
-import struct
-import xml.etree.ElementTree as ET
 import time
-import csv, json
+import json
 from datetime import datetime
-import pandas as pd
 import requests
 import os
 import threading
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-import requests
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from emotion_features import EmotionFeatureEngine
+from emotion_window import EmotionTraceBuffer, EmotionWindowAggregator
+from log_archive import RotatingSessionLog, SessionLogArchive
+from stimulus_index import StimulusIndex, stimulus_aggregates
+from emotion_outbox import EmotionOutbox
+from metrics import Metrics, MetricsServer
+from push_pipeline import EmotionSender, PushPolicy, pooled_session
+from facereader_protocol import (FrameDecoder, ResponseRouter, build_action_packet, build_packet,
+                                 parse_classification)
 
 class FaceReaderConnector:
-    def __init__(self, host=None, port=None, server_url=None, log_dir='logs'):
+    def __init__(self, host=None, port=None, server_url=None, log_dir='logs', streaming=True, log_format='csv',
+                 backpressure='drop_oldest', upload_fps=5, wire_format='json', compression=None,
+                 log_archive=None):
         self.host = host
         self.port = port
         self.server_url = server_url
         self.log_dir = log_dir
         os.makedirs(self.log_dir, exist_ok=True)
         self.sock = None
+        self.decoder = None
+        # Replies are matched to their ActionMessage by <Id>; one thread reads the socket at a time
+        self.responses = ResponseRouter()
+        self._send_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self.response_timeout = 10
+        self.session_writer = None
+        # Rotation, background compression and retention of the logs under log_dir (every user)
+        self.log_archive = log_archive or SessionLogArchive(self.log_dir)
+        # Stimulus segments of the session log (<log>.stimuli.json); changes requested from
+        # other threads are queued and applied by the receive loop at the next frame
+        self.current_stimulus = None
+        self.stimulus_index = None
+        self._stimulus_marks = []
+        # 'csv' (long format text) or 'binary' (columnar .frsb, see session_binary)
+        self.log_format = log_format
+        self.session_id = None
+        self.emotion_window = EmotionWindowAggregator()
+        # Rolling features of the whole session (EMA, valence/arousal stats, dwell, transitions)
+        self.emotion_features = EmotionFeatureEngine()
+        # Last frames for the live plot (fixed size, filled by the receive path)
+        self.emotion_trace = EmotionTraceBuffer()
         self.log_enabled_global = False
         self.offset_send_seconds = 1
+        # Push cadence: flush on max records, max age or target latency, adapted to POST round trips
+        self.push_policy = PushPolicy(initial_interval=self.offset_send_seconds)
+        # What to do when the upload falls behind, with bounded memory in every case:
+        # 'block' stalls the receive loop, 'drop_oldest' drops queued batches,
+        # 'decimate' uploads at most `upload_fps` frames per second (the log keeps every frame)
+        if backpressure not in ('block', 'drop_oldest', 'decimate'):
+            raise ValueError(f"Unknown backpressure policy: {backpressure}")
+        self.backpressure = backpressure
+        self.upload_fps = upload_fps
+
+        # Streaming mode: enable DetailedLogSending once and consume every
+        # Classification until stop_session, instead of one round trip per frame.
+        self.streaming = streaming
+        self.stream_poll_seconds = 0.5
+        self.session_stats = {"frames_received": 0, "frames_dropped": 0}
+
+        # Pooled keep-alive session; /submit_emotion batches go through a background sender
+        self.http = pooled_session()
+        self.sender = None
+        # /submit_emotion encoding, see emotion_codec: 'json' or 'columnar', optionally gzip/zstd compressed
+        self.wire_format = wire_format
+        self.compression = compression
+
+        # Per-stage counters and latency histograms (recv, parse, log, aggregate, push, end_to_end, end_to_end_replayed)
+        self.metrics = Metrics()
+        self.metrics_server = None
 
-        # self.http = requests.Session()
-        # self.http.trust_env = False  # avoids Windows proxy/AV issues in many cases
-        # retry = Retry(
-        #     total=5,
-        #     connect=5,
-        #     read=5,
-        #     backoff_factor=0.5,
-        #     status_forcelist=(429, 500, 502, 503, 504),
-        #     allowed_methods=frozenset(["POST", "GET"]),
-        #     raise_on_status=False,
-        # )
-        # adapter = HTTPAdapter(max_retries=retry, pool_connections=20, pool_maxsize=20)
-        # self.http.mount("https://", adapter)
-        # self.http.mount("http://", adapter)
-        
-    # def _post(self, path: str, payload: dict) -> bool:
-    #     url = self.server_url.rstrip("/") + path
-    #     try:
-    #         r = self.http.post(
-    #             url,
-    #             json=payload,
-    #             timeout=(3.05, 10),              # connect, read
-    #             headers={"Connection": "close"}, # reduces flaky keep-alive behavior with some middleboxes
-    #         )
-    #         # If you want to treat non-2xx as failure:
-    #         if r.status_code >= 400:
-    #             print(f"[WARN] {url} -> {r.status_code}: {r.text[:200]}")
-    #             return False
-    #         return True
-    #     except requests.exceptions.SSLError as e:
-    #         # This is your SSLEOF case: log and continue instead of killing the thread
-    #         print(f"[WARN] SSL error posting to {url}: {e}")
-    #         return False
-    #     except requests.exceptions.RequestException as e:
-    #         print(f"[WARN] Request error posting to {url}: {e}")
-    #         return False
-    
     def connect(self):
         """Establish a connection to the FaceReader server."""
         # try:
@@ -76,243 +94,343 @@ class FaceReaderConnector:
             self.sock.close()
             self.sock = None
             print("Disconnected from FaceReader.")
+        self.responses.fail_all(ConnectionError("Disconnected from FaceReader"))
     
     
     def build_packet(self, message_type: str, xml_string: str) -> bytes:
         """Construct the message bytes according to FaceReader format."""
-        type_bytes = message_type.encode('utf-8')
-        xml_bytes = xml_string.encode('utf-8')
-        type_length = len(type_bytes)
-        message_bytes = struct.pack('<I', type_length) + type_bytes + xml_bytes
-        packet_length = len(message_bytes) + 4
-        return struct.pack('<I', packet_length) + message_bytes
-
-    def send_action_message(self, action_type: str, msg_id: str = "ID001", information: list[str] = None):
-        """Send an action message (e.g., start analyzing, request stimuli)."""
-        xml = f"""<?xml version="1.0" encoding="utf-8"?>
-                    <ActionMessage xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-                                xmlns:xsd="http://www.w3.org/2001/XMLSchema">
-                    <Id>{msg_id}</Id>
-                    <ActionType>{action_type}</ActionType>"""
-        if information:
-            xml += "\n  <Information>\n"
-            for item in information:
-                xml += f"    <string>{item}</string>\n"
-            xml += "  </Information>\n"
-        xml += "</ActionMessage>"
-
-        packet = self.build_packet("FaceReaderAPI.Messages.ActionMessage", xml)
-        self.sock.sendall(packet)
+        return build_packet(message_type, xml_string)
+
+    def send_action_message(self, action_type: str, msg_id: str = None, information: list[str] = None):
+        """Send an action message (e.g., start analyzing, request stimuli) without waiting; returns its Id."""
+        msg_id = msg_id or self.responses.next_id()
+        packet = build_action_packet(action_type, msg_id, information)
+        with self._send_lock:
+            self.sock.sendall(packet)
         print(f"Sent: {action_type}")
+        return msg_id
 
-    def read_response(self):
-        """Read and print one full XML response from the socket."""
-        header = self.sock.recv(4)
-        if not header:
-            return None
-
-        total_length = struct.unpack('<I', header)[0]
-        message_data = self.sock.recv(total_length - 4)
-
-        # Skip the typename length and typename
-        type_len = struct.unpack('<I', message_data[:4])[0]
-        xml_start = 4 + type_len
-        xml_data = message_data[xml_start:]
+    def request_action(self, action_type: str, information: list[str] = None):
+        """
+        Send an action message and return a Future resolved with the parsed
+        ResponseMessage that echoes its Id. Several requests can be in
+        flight; replies are picked up by whichever thread reads the socket.
+        """
+        future = Future()
+        msg_id = self.responses.register(action_type, future)
+        try:
+            self.send_action_message(action_type, msg_id, information)
+        except OSError:
+            self.responses.discard(msg_id)
+            raise
+        return future
 
-        print("Received XML:")
-        print(xml_data.decode('utf-8'))
+    def wait_reply(self, future, timeout=None):
+        """
+        Result of a request_action Future. While a session loop reads the
+        socket this just waits; otherwise the calling thread reads and
+        dispatches messages itself until the reply arrives.
+        Raises concurrent.futures.TimeoutError after `timeout` seconds.
+        """
+        timeout = self.response_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while not future.done():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise FutureTimeoutError()
+            if not self._read_lock.acquire(timeout=min(remaining, 0.05)):
+                try:
+                    return future.result(timeout=min(remaining, 0.5))
+                except FutureTimeoutError:
+                    continue
+            try:
+                previous = self.sock.gettimeout()
+                self.sock.settimeout(min(remaining, self.stream_poll_seconds))
+                try:
+                    # Anything that is not a reply is not claimed outside a session
+                    if self.read_message() is None:
+                        raise ConnectionError("Connection closed while waiting for a reply")
+                except socket.timeout:
+                    pass
+                finally:
+                    self.sock.settimeout(previous)
+            finally:
+                self._read_lock.release()
+        return future.result()
+
+    def score_stimulus(self, name):
+        """Mark the start of a stimulus in the FaceReader analysis; returns the reply Future."""
+        return self.request_action("FaceReader_Score_Stimulus", [name])
+
+    def score_event_marker(self, name):
+        """Mark an event in the FaceReader analysis; returns the reply Future."""
+        return self.request_action("FaceReader_Score_EventMarker", [name])
+
+    def _frame_decoder(self):
+        """Buffered decoder bound to the current socket."""
+        if self.decoder is None or self.decoder.sock is not self.sock:
+            self.decoder = FrameDecoder(self.sock)
+        return self.decoder
 
-        # Optional: parse with ElementTree
+    def read_response(self):
+        """Read until the next ResponseMessage and return it parsed (other messages are skipped)."""
+        decoder = self._frame_decoder()
+        while True:
+            frame = decoder.read_frame()
+            if frame is None:
+                return None
+            type_name, xml_data = frame
+            if self.responses.is_response(type_name):
+                print("Received XML:")
+                print(bytes(xml_data).decode('utf-8', errors='replace'))
+                return self.responses.dispatch(xml_data)
+
+    def log_classification_to_csv(self, record, csv_path, timestamp_actual):
+        if (self.session_writer is None or self.session_writer.closed
+                or self.session_writer.csv_path != csv_path):
+            self.close_session_log()
+            self.session_writer = RotatingSessionLog(csv_path, self.log_archive)
+        self.session_writer.write_record(record, timestamp_actual)
+
+    def _log_offset(self):
+        """Position of the next frame in the current log segment (0 before the first frame)."""
+        writer = self.session_writer
+        if writer is None or writer.closed:
+            return 0
+        return writer.offset()
+
+    def _apply_stimulus_marks(self, frame):
+        """Start a stimulus segment at `frame` for every queued stimulus change."""
+        while self._stimulus_marks:
+            stimulus, timestamp = self._stimulus_marks.pop(0)
+            self.stimulus_index.start(stimulus, timestamp, frame, self._log_offset())
+            self.stimulus_index.save()
+
+    def rotate_session_log(self, frame, timestamp_actual):
+        """
+        Continue the session log in a new segment from `frame` on. The old
+        segment is compressed in the background; the open stimulus goes on
+        in the stimulus index of the new segment.
+        """
+        index = self.stimulus_index
+        current = index.current if index is not None else None
+        if current is not None:
+            index.end(timestamp_actual, frame - 1 if frame is not None else None, self._log_offset())
+            index.save()
+        path = self.session_writer.rotate()
+        self.stimulus_index = StimulusIndex(path)
+        if current is not None:
+            self.stimulus_index.start(current["stimulus"], timestamp_actual, frame, 0)
+            self.stimulus_index.save()
+
+    def _close_stimulus_index(self):
+        """Apply the last stimulus changes and close the open segment at the end of the log."""
+        index = self.stimulus_index
+        if index is None:
+            return
+        last_frame = self.session_stats.get("last_frame")
+        self._apply_stimulus_marks(last_frame + 1 if last_frame is not None else None)
+        if index.segments:
+            index.end(datetime.now().timestamp(), last_frame, self._log_offset())
+            index.save()
+
+    def handle_classification(self, record, csv_path, timestamp_actual):
+        """Log one parsed frame and feed it to the push window."""
+        writer = self.session_writer
+        if writer is not None and writer.csv_path == csv_path and writer.rotate_due():
+            self.rotate_session_log(record.frame_number, timestamp_actual)
+        if self._stimulus_marks:
+            self._apply_stimulus_marks(record.frame_number)
+        start = time.perf_counter()
+        self.log_classification_to_csv(record, csv_path, timestamp_actual)
+        logged = time.perf_counter()
+        self.emotion_window.add(record, timestamp_actual)
+        self.emotion_features.update(record, timestamp_actual)
+        self.emotion_trace.add(record, timestamp_actual)
+        self.metrics.observe("log", logged - start)
+        self.metrics.observe("aggregate", time.perf_counter() - logged)
+
+    def parse_message(self, xml_data):
+        """Parse a message as a Classification; None if it is not one or is malformed."""
+        start = time.perf_counter()
         try:
-            root = ET.fromstring(xml_data.decode('utf-8'))
-            return root
-        except Exception as e:
-            print("Failed to parse XML:", e)
+            record = parse_classification(xml_data)
+        except ValueError as e:
+            print("XML parsing error:", e)
+            self.metrics.incr("parse_errors")
             return None
+        self.metrics.observe("parse", time.perf_counter() - start)
+        return record
 
-    def log_classification_to_csv(self, root, csv_path, timestamp_actual):
-        frame = root.find("FrameNumber").text if root.find("FrameNumber") is not None else "?"
-        ticks = root.find("FrameTimeTicks").text if root.find("FrameTimeTicks") is not None else "?"
-        with open(csv_path, mode='a', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            for val in root.findall(".//ClassificationValue"):
-                label = val.find("Label").text if val.find("Label") is not None else "?"
-                typ = val.find("Type").text
-                if typ == "Value":
-                    value = val.find("Value/float")
-                    value = value.text if value is not None else ""
-                    writer.writerow([frame, ticks, label, typ, value, timestamp_actual])
-                elif typ == "State":
-                    state = val.find("State/string")
-                    state = state.text if state is not None else ""
-                    writer.writerow([frame, ticks, label, typ, state, timestamp_actual])
+    def close_session_log(self):
+        """Flush and close the session log writer, if any; the archive then compresses its last segment."""
+        if self.session_writer is not None:
+            self.session_writer.close()
 
-    def receive_and_log(self, csv_path, timestamp_actual):
+    def read_message(self):
+        """
+        Read one framed message and return its XML payload as a memoryview,
+        valid until the next read. Returns None if the connection closed.
+        """
+        start = time.perf_counter()
+        decoder = self._frame_decoder()
         while True:
-            header = self.sock.recv(4)
-            if not header:
-                print("Connection closed.")
+            frame = decoder.read_frame()
+            if frame is None:
+                return None
+            type_name, xml_data = frame
+            if not self.responses.is_response(type_name):
                 break
+            # Replies to pending actions are routed to their futures, not to the caller
+            self.responses.dispatch(xml_data)
+            self.metrics.incr("responses_received")
+        # Includes the wait for FaceReader to send the frame
+        self.metrics.observe("recv", time.perf_counter() - start)
+        return xml_data
 
-            total_len = struct.unpack('<I', header)[0]
-            payload = b""
-            while len(payload) < total_len - 4:
-                packet = self.sock.recv(total_len - 4 - len(payload))
-                if not packet:
-                    break
-                payload += packet
-
-            if len(payload) < 4:
-                continue
-
-            type_len = struct.unpack('<I', payload[:4])[0]
-            xml_data = payload[4 + type_len:].decode('utf-8')
-
+    def receive_and_log(self, csv_path, timestamp_actual):
+        """Log the next Classification; gives up when stop_session is called or the connection closes."""
+        while True:
             try:
-                root = ET.fromstring(xml_data)
-                if root.tag == "Classification":
-                    self.log_classification_to_csv(root, csv_path, timestamp_actual)
+                xml_data = self.read_message()
+            except socket.timeout:
+                if not self.log_enabled_global:
                     break
-            except Exception as e:
-                print("XML parsing error:", e)
                 continue
+            if xml_data is None:
+                print("Connection closed.")
+                break
 
-    def push_to_server(self, csv_path, timestamp_start, timestamp_end):
-        column_names = ['Frame', 'FrameTicks', 'Feature', 'Attribute', 'Value', 'Timestamp']
-        try:
-            df = pd.read_csv(csv_path, header=None, names=column_names)
-        except Exception as e:
-            print(f"Failed to read CSV: {e}")
-            return
+            record = self.parse_message(xml_data)
+            if record is not None:
+                self._count_frame(record)
+                self.handle_classification(record, csv_path, timestamp_actual)
+                break
 
-        if len(df) == 0:
+    def _count_frame(self, record):
+        """Update the received/dropped counters from the frame number of a Classification."""
+        self.session_stats["frames_received"] += 1
+        self.metrics.incr("frames_received")
+        frame = record.frame_number
+        if frame is None:
             return
+        last_frame = self.session_stats.get("last_frame")
+        if last_frame is not None and frame > last_frame + 1:
+            self.session_stats["frames_dropped"] += frame - last_frame - 1
+            self.metrics.incr("frames_dropped", frame - last_frame - 1)
+        self.session_stats["last_frame"] = frame
 
-        emotions = ['Neutral', 'Happy', 'Sad', 'Angry', 'Surprised', 'Scared', 'Disgusted']
+    def stream_and_log(self, csv_path):
+        """
+        Streaming loop: consume every Classification as it arrives and push
+        to the server whenever the push policy asks for it, until stop_session.
+        """
+        self.send_action_message("FaceReader_Start_DetailedLogSending")
+        self.sock.settimeout(self.stream_poll_seconds)
+        time_stamp_check_offset = datetime.now().timestamp()
+        try:
+            while self.log_enabled_global:
+                try:
+                    xml_data = self.read_message()
+                except socket.timeout:
+                    xml_data = b""
+                if xml_data is None:
+                    print("Connection closed.")
+                    break
 
-        # # Filter rows corresponding to emotions
-        # emotion_df = df[
-        #     (df['Attribute'] == 'Value') &
-        #     (df['Feature'].isin(emotions))
-        # ]
-        
-        # ## FILTER BY TIMESTAMP
-        # emotion_df['Timestamp'] = emotion_df['Timestamp'].astype(float)
-
-        # # Filter by timestamp range
-        # emotion_df = emotion_df[
-        #     (emotion_df['Timestamp'] >= timestamp_start) &
-        #     (emotion_df['Timestamp'] <= timestamp_end)
-        # ]
-        
-        # if len(emotion_df) == 0:
-        #     print("No recent emotions, skip")
-        #     return
-        # print(emotion_df)
-        # # exit()
-        
-        # max_idx = emotion_df['Value'].astype(float).idxmax()
-
-        # # Retrieve the dominant emotion and its intensity
-        # dominant_emotion = emotion_df.loc[max_idx, 'Feature']
-        # dominant_value = float(emotion_df.loc[max_idx, 'Value'])
-
-        # # Extract valence value
-        # valence_row = df[(df['Feature'] == 'Valence') & (df['Attribute'] == 'Value')]
-        # valence = float(valence_row['Value'].values[0]) if not valence_row.empty else None
-
-        # # Extract arousal value
-        # arousal_row = df[(df['Feature'] == 'Arousal') & (df['Attribute'] == 'Value')]
-        # arousal = float(arousal_row['Value'].values[0]) if not arousal_row.empty else None
-
-        # # Prepare data to send
-        # emotion_data = {
-        #     'emotion': dominant_emotion,
-        #     'intensity': dominant_value,
-        #     'valence': valence,
-        #     'arousal': arousal,
-        #     'timestamp_actual':timestamp_end,
-        # }
-        
-         # Ensure numeric types where needed
-        df = df.copy()
-        df['Timestamp'] = pd.to_numeric(df['Timestamp'], errors='coerce')
-        df['Value'] = pd.to_numeric(df['Value'], errors='coerce')
-
-        # Filter by timestamp range (apply to all features so valence/arousal align per frame)
-        df_win = df[(df['Timestamp'] >= timestamp_start) & (df['Timestamp'] <= timestamp_end)].copy()
-        if df_win.empty:
-            print("No recent data in timestamp window, skip")
-            return
+                if xml_data:
+                    record = self.parse_message(xml_data)
+                    if record is not None:
+                        self._count_frame(record)
+                        self.handle_classification(record, csv_path, datetime.now().timestamp())
 
-        # Emotion rows in window
-        emotion_df = df_win[
-            (df_win['Attribute'] == 'Value') &
-            (df_win['Feature'].isin(emotions)) &
-            (df_win['Value'].notna())
-        ].copy()
+                timestamp_loop = datetime.now().timestamp()
+                if self._push_due(timestamp_loop):
+                    self.push_to_server(csv_path, time_stamp_check_offset, timestamp_loop)
+                    time_stamp_check_offset = timestamp_loop
+            # Frames received since the last push
+            self.push_to_server(csv_path, time_stamp_check_offset, datetime.now().timestamp())
+        finally:
+            if self.sock:
+                try:
+                    self.send_action_message("FaceReader_Stop_DetailedLogSending")
+                except OSError as e:
+                    print("Error stopping detailed log sending:", e)
+            print(f"Frames received: {self.session_stats['frames_received']}, "
+                  f"dropped: {self.session_stats['frames_dropped']}")
+
+    def _push_due(self, timestamp_now):
+        """Ask the push policy whether the pending window should be sent now."""
+        oldest = self.emotion_window.oldest_timestamp()
+        return self.push_policy.should_flush(len(self.emotion_window),
+                                             timestamp_now - oldest if oldest is not None else 0.0)
 
-        if emotion_df.empty:
+    def push_to_server(self, csv_path, timestamp_start, timestamp_end):
+        """
+        Queue the frames aggregated since the last push, up to `timestamp_end`,
+        for the background sender. Frames come from the in-memory window;
+        `csv_path` is only the audit log.
+        """
+        start = time.perf_counter()
+        ACC_EMOTION_DATA = self.emotion_window.drain(timestamp_end)
+        self.metrics.observe("aggregate", time.perf_counter() - start)
+        if not ACC_EMOTION_DATA:
             print("No recent emotions, skip")
             return
-
-        # 1) GROUP BY FRAME -> pick max emotion per frame
-        # idxmax per group gives the row index of the max Value within each Frame
-        idx = emotion_df.groupby('Frame')['Value'].idxmax()
-        dom_per_frame = emotion_df.loc[idx].copy()
-
-        # Optional: process in temporal order
-        dom_per_frame = dom_per_frame.sort_values(['Timestamp', 'Frame'])
-
-        # Precompute valence/arousal lookup per frame (within the same window)
-        def per_frame_lookup(feature_name: str):
-            tmp = df_win[(df_win['Feature'] == feature_name) & (df_win['Attribute'] == 'Value')].copy()
-            tmp = tmp.dropna(subset=['Value'])
-            # If multiple per frame, keep the last by timestamp
-            tmp = tmp.sort_values(['Frame', 'Timestamp']).groupby('Frame', as_index=False).tail(1)
-            return dict(zip(tmp['Frame'], tmp['Value']))
-
-        valence_map = per_frame_lookup('Valence')
-        arousal_map = per_frame_lookup('Arousal')
-
-        # 2) PUSH ONE REQUEST PER FRAME CONSIDERED
-        ACC_EMOTION_DATA = []
-        for _, r in dom_per_frame.iterrows():
-            frame_id = r['Frame']
-            dominant_emotion = r['Feature']
-            dominant_value = float(r['Value'])
-
-            valence = float(valence_map.get(frame_id)) if frame_id in valence_map else None
-            arousal = float(arousal_map.get(frame_id)) if frame_id in arousal_map else None
-
-            emotion_data = {
-                'frame': int(frame_id) if pd.notna(frame_id) else frame_id,
-                'emotion': dominant_emotion,
-                'intensity': dominant_value,
-                'valence': valence,
-                'arousal': arousal,
-                'timestamp_actual': float(r['Timestamp']),  # per-frame timestamp
-            }
-            ACC_EMOTION_DATA.append(emotion_data)
-
-            # send it (replace with your actual request call)
-            # self._post_emotion(emotion_data)
-            # or requests.post(self.server_url, json=emotion_data)
-            # print("PUSH:", emotion_data)
-            ### SEND TO SERVER
-            
-            # response = requests.post(self.server_url + "/submit_emotion", json=emotion_df.to_json(orient="records"))
-            # # Print the server's response
-            # print(f"Sent: {emotion_df}, Received: {response.status_code}, {response.text}")
-            
-        response = requests.post(self.server_url + "/submit_emotion", json=ACC_EMOTION_DATA)
-        # Print the server's response
-        # ok = self._post("/submit_emotion", emotion_data)
-        # if ok:
-        #     print(f"Sent: {emotion_data}, Received: {response.status_code}, {response.text}")
-        # else:
-        #     print("ERROR IN SENT")
-        print(f"Sent: {emotion_data}, Received: {response.status_code}, {response.text}")
+        self.metrics.incr("batches_pushed")
+        self.metrics.incr("records_pushed", len(ACC_EMOTION_DATA))
+        if self.sender is None:
+            self.start_sender()
+        self.sender.submit(ACC_EMOTION_DATA)
+        # Rolling features go to their own endpoint, so every record keeps the same keys
+        self.sender.submit_features({"session_id": self.session_id, "features": self.emotion_features.snapshot()})
+
+    def start_sender(self):
+        """Start the background /submit_emotion sender, backed by an outbox in log_dir."""
+        outbox_path = os.path.join(self.log_dir, "outbox.sqlite3")
+        if self.sender is not None and self.sender.outbox.path != outbox_path:
+            self.sender.stop()
+            self.sender.outbox.close()
+            self.sender = None
+        if self.sender is None:
+            self.sender = EmotionSender(self.server_url, http=self.http, outbox=EmotionOutbox(outbox_path),
+                                        metrics=self.metrics, policy=self.push_policy,
+                                        overflow='block' if self.backpressure == 'block' else 'drop_oldest',
+                                        wire_format=self.wire_format, compression=self.compression)
+        self.sender.start()
+
+    def stop_sender(self):
+        """Send the batches still queued and stop the background sender."""
+        if self.sender is not None:
+            self.sender.stop()
+            print(f"Sender stats: {self.sender.stats()}")
+
+    def metrics_snapshot(self):
+        """Counters, per-stage latency histograms, session and sender stats."""
+        snapshot = self.metrics.snapshot()
+        snapshot["session"] = {k: v for k, v in self.session_stats.items()}
+        snapshot["sender"] = self.sender.stats() if self.sender is not None else None
+        snapshot["push_policy"] = self.push_policy.stats()
+        snapshot["backpressure"] = self.backpressure_stats()
+        snapshot["log_archive"] = self.log_archive.stats()
+        return snapshot
+
+    def backpressure_stats(self):
+        """Frames and batches lost or thinned out on the way to the server."""
+        sender = self.sender.stats() if self.sender is not None else {}
+        return {
+            "policy": self.backpressure,
+            "frames_decimated": self.emotion_window.frames_decimated,
+            "frames_overflowed": self.emotion_window.frames_overflowed,
+            "batches_dropped": sender.get("batches_dropped", 0),
+            "seconds_blocked": sender.get("seconds_blocked", 0.0),
+        }
+
+    def start_metrics_server(self, port=9100):
+        """Serve metrics_snapshot() as JSON on http://127.0.0.1:<port>/metrics."""
+        if self.metrics_server is None:
+            self.metrics_server = MetricsServer(self.metrics_snapshot, port=port).start()
+        return self.metrics_server
 
     def set_log_dir(self, user_name):
         self.log_dir = f"logs/{user_name}"
@@ -321,10 +439,30 @@ class FaceReaderConnector:
         return response
 
     def set_stimuli(self, stimuli):
+        """Make `stimuli` the active stimulus: a new segment of the session log index, and on the server."""
+        self.current_stimulus = stimuli
+        if self.log_enabled_global:
+            self._stimulus_marks.append((stimuli, datetime.now().timestamp()))
         response = requests.post(self.server_url  + "/set_current_stimuli", json={"stimuli":stimuli})
         return response.json()["log"]
     
-    def aggregate_emotions(self):
+    def stimulus_aggregates(self, log_path=None):
+        """
+        Dominant emotion histogram and mean valence/arousal per stimulus of a
+        session log segment (default: the current or last one of the current
+        or last session), read by seeking to each stimulus segment.
+        """
+        if log_path is None:
+            if self.stimulus_index is None:
+                return []
+            # During a session this covers the rows flushed so far
+            return stimulus_aggregates(self.stimulus_index.log_path, index=self.stimulus_index)
+        return stimulus_aggregates(log_path)
+
+    def aggregate_emotions(self, local=False):
+        """Session aggregate from the server, or from the client-side features with local=True."""
+        if local:
+            return self.emotion_features.summary()
         response = requests.get(self.server_url  + "/aggregate_emotions")
         to_return = response.json()["log"]
         requests.post(self.server_url + "/submit_chat_log", json={"VALUE": "Emotions Aggregated for Prompt", "LOGTYPE": "EMOTIONS_AGGREGATED", "mode": "emotion conditioning"})
@@ -343,31 +481,61 @@ class FaceReaderConnector:
         """
         
         try:
-            self.send_action_message("FaceReader_Start_Analyzing")
-            self.read_response()  # Optional: read initial response
+            try:
+                self.wait_reply(self.request_action("FaceReader_Start_Analyzing"))
+            except FutureTimeoutError:
+                print("No reply to FaceReader_Start_Analyzing, continuing.")
             self.log_enabled_global = True
             timestamp_beginning = datetime.now().timestamp()
-            csv_path = os.path.join(self.log_dir, f"data_{timestamp_beginning}.csv")
-
-            time_stamp_check_offset = datetime.now().timestamp()
+            extension = "frsb" if self.log_format == "binary" else "csv"
+            csv_path = os.path.join(self.log_dir, f"data_{timestamp_beginning}.{extension}")
+            self.session_id = uuid.uuid4().hex
+            self.session_stats = {"frames_received": 0, "frames_dropped": 0, "last_frame": None}
+            self.stimulus_index = StimulusIndex(csv_path)
+            # Drop the sessions past the retention before this one grows the logs
+            self.log_archive.sweep()
+            self._stimulus_marks = [(self.current_stimulus, timestamp_beginning)] if self.current_stimulus else []
+            self.metrics.reset()
+            self.emotion_features.reset()
+            self.emotion_window = EmotionWindowAggregator(
+                session_id=self.session_id,
+                upload_fps=self.upload_fps if self.backpressure == 'decimate' else None,
+            )
+            self.start_sender()
+
+            # The session loop is the only reader of the socket until it ends
+            with self._read_lock:
+                if self.streaming:
+                    self.stream_and_log(csv_path)
+                    return
+
+                time_stamp_check_offset = datetime.now().timestamp()
+                self.sock.settimeout(self.stream_poll_seconds)
+
+                while self.log_enabled_global:
+                    round_trip = time.perf_counter()
+                    self.send_action_message("FaceReader_Start_DetailedLogSending")
+                    timestamp_actual = datetime.now().timestamp()
+                    self.receive_and_log(csv_path, timestamp_actual)
+                    self.send_action_message("FaceReader_Stop_DetailedLogSending")
+                    self.metrics.observe("detailed_log_round_trip", time.perf_counter() - round_trip)
+                    timestamp_loop = datetime.now().timestamp()
+                    if self._push_due(timestamp_loop):
+                        self.push_to_server(csv_path, time_stamp_check_offset, timestamp_loop)
+                        time_stamp_check_offset = timestamp_loop
+                    if not self.log_enabled_global:
+                        break
+                # Frames received since the last push
+                self.push_to_server(csv_path, time_stamp_check_offset, datetime.now().timestamp())
 
-            while self.log_enabled_global:
-                self.send_action_message("FaceReader_Start_DetailedLogSending")
-                timestamp_actual = datetime.now().timestamp()
-                self.receive_and_log(csv_path, timestamp_actual)
-                self.send_action_message("FaceReader_Stop_DetailedLogSending")
-                timestamp_loop = datetime.now().timestamp()
-                if timestamp_loop > (time_stamp_check_offset + self.offset_send_seconds):
-                    self.push_to_server(csv_path, time_stamp_check_offset, timestamp_loop)
-                    time_stamp_check_offset = timestamp_loop
-                if not self.log_enabled_global:
-                    break
-               
         except KeyboardInterrupt:
             print("Analysis session interrupted by user.")
             self.send_action_message("FaceReader_Stop_Analyzing")
         finally:
+            self._close_stimulus_index()
+            self.close_session_log()
             self.disconnect()
+            self.stop_sender()
 
 
     def stop_session(self):
@@ -388,7 +556,8 @@ if __name__ == '__main__':
         host=config_data["HOST"],
         port=config_data["PORT"],
         server_url = config_data["SERVER_URL"],
-        log_dir='logs'
+        log_dir='logs',
+        log_archive=SessionLogArchive.from_config('logs', config_data),
     )
     
     connector.connect()
@@ -0,0 +1,545 @@
+import asyncio
+import os
+import struct
+import time
+import uuid
+from datetime import datetime
+
+import aiohttp
+
+from emotion_features import EmotionFeatureEngine
+from emotion_window import EmotionWindowAggregator
+from emotion_codec import encode_batch, finite
+from emotion_outbox import EmotionOutbox
+from facereader_protocol import ResponseRouter, build_action_packet, parse_classification
+from push_pipeline import PushPolicy
+from log_archive import RotatingSessionLog, SessionLogArchive
+
+
+class AsyncEmotionSender:
+    """
+    Bounded upload queue for /submit_emotion batches, drained by one task
+    that posts with retries and exponential backoff. `http` is a callable
+    returning the aiohttp session to use. POST outcomes are reported to
+    `policy` (a PushPolicy) when given. Batches are encoded as in
+    EmotionSender (`wire_format`, `compression`, fallback to JSON on 400/415).
+
+    With an EmotionOutbox every batch is stored before it is queued, and
+    batches that failed or were dropped are replayed when the queue is idle,
+    as in EmotionSender. The outbox is used from worker threads, so SQLite
+    never blocks the event loop. Session features are posted to
+    `features_url` as in EmotionSender.submit_features.
+    """
+
+    def __init__(self, url, http, max_queue=256, max_attempts=4, backoff_seconds=0.5, policy=None,
+                 wire_format="json", compression=None, outbox=None, replay_records_per_second=500,
+                 replay_batch_limit=50, replay_retry_seconds=5.0, features_url=None):
+        self.url = url
+        self.http = http
+        self.policy = policy
+        self.wire_format = wire_format
+        self.compression = compression
+        self.payload_bytes = 0
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+        self.batches_sent = 0
+        self.batches_failed = 0
+        self.batches_dropped = 0
+        self.last_latency = None
+        self.outbox = outbox
+        self.replay_records_per_second = replay_records_per_second
+        self.replay_batch_limit = replay_batch_limit
+        self.replay_retry_seconds = replay_retry_seconds
+        self._queued_ids = set()
+        self._next_replay = 0.0
+        self.batches_replayed = 0
+        self.features_url = features_url
+        # Latest features snapshot per session, not posted yet
+        self._features = {}
+        self.features_sent = 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, batch):
+        """Queue a batch, stored in the outbox first if any; the oldest batch is dropped when full."""
+        outbox_id = None
+        if self.outbox is not None:
+            outbox_id = await asyncio.to_thread(self.outbox.add, batch)
+            self._queued_ids.add(outbox_id)
+        if self._queue.full():
+            dropped_id, _ = self._queue.get_nowait()
+            self._queue.task_done()
+            # Still pending in the outbox, it will be replayed
+            self._queued_ids.discard(dropped_id)
+            self.batches_dropped += 1
+        self._queue.put_nowait((outbox_id, batch))
+
+    def submit_features(self, payload):
+        """Queue `payload` ({"session_id": ..., "features": {...}}), replacing the unsent one of its session."""
+        self._features[payload.get("session_id")] = payload
+
+    async def _post_features(self):
+        """Post the pending features snapshots once each; a failed one is superseded by the next."""
+        pending = list(self._features.values())
+        self._features.clear()
+        for payload in pending:
+            if self.features_url is None:
+                return
+            try:
+                async with self.http().post(self.features_url, json=finite(payload)) as response:
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"[WARN] Request error posting to {self.features_url}: {e}")
+                continue
+            if status in (404, 405):
+                print(f"[WARN] {self.features_url} -> {status}, not sending features")
+                self.features_url = None
+            elif status < 300:
+                self.features_sent += 1
+            else:
+                print(f"[WARN] {self.features_url} -> {status}")
+
+    async def post(self, batch):
+        """Post one batch with retries. Returns the last HTTP status, or None if no response."""
+        status = None
+        body, headers = encode_batch(batch, self.wire_format, self.compression)
+        self.payload_bytes += len(body)
+        for attempt in range(self.max_attempts):
+            if attempt:
+                await asyncio.sleep(self.backoff_seconds * (2 ** (attempt - 1)))
+            start = time.perf_counter()
+            try:
+                async with self.http().post(self.url, data=body, headers=headers) as response:
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"[WARN] Request error posting to {self.url}: {e}")
+                if self.policy is not None:
+                    self.policy.record(None, False)
+                continue
+            self.last_latency = time.perf_counter() - start
+            if self.policy is not None:
+                self.policy.record(self.last_latency, status < 300)
+            if status in (400, 415) and (self.wire_format != "json" or self.compression is not None):
+                print(f"[WARN] {self.url} does not accept {self.wire_format}/{self.compression}, falling back to JSON")
+                self.wire_format = "json"
+                self.compression = None
+                body, headers = encode_batch(batch)
+                self.payload_bytes += len(body)
+                continue
+            if status < 500 and status != 429:
+                return status
+            print(f"[WARN] {self.url} -> {status}")
+        return status
+
+    async def _run(self):
+        while True:
+            try:
+                outbox_id, batch = await asyncio.wait_for(self._queue.get(), 0.2)
+            except asyncio.TimeoutError:
+                try:
+                    await self._post_features()
+                    await self._replay_backlog()
+                except Exception as e:
+                    print(f"[WARN] Sender failed replaying the outbox: {e!r}")
+                    self.batches_failed += 1
+                    self._next_replay = time.monotonic() + self.replay_retry_seconds
+                continue
+            try:
+                status = await self.post(batch)
+                self._queued_ids.discard(outbox_id)
+                if status is not None and 200 <= status < 300:
+                    self.batches_sent += 1
+                    await self._post_features()
+                else:
+                    self.batches_failed += 1
+                if status is not None and status < 500 and status != 429:
+                    if outbox_id is not None:
+                        await asyncio.to_thread(self.outbox.mark_delivered, [outbox_id], status)
+                else:
+                    # Server unreachable: leave it in the outbox and wait before replaying
+                    self._next_replay = time.monotonic() + self.replay_retry_seconds
+            except Exception as e:
+                # A batch that cannot be encoded or stored must not stop the task
+                print(f"[WARN] Sender failed on a batch of {len(batch)} records: {e!r}")
+                self._queued_ids.discard(outbox_id)
+                self.batches_failed += 1
+                self._next_replay = time.monotonic() + self.replay_retry_seconds
+            finally:
+                self._queue.task_done()
+
+    async def _replay_backlog(self):
+        """Send the oldest undelivered outbox batches as one bulk POST, within the throughput cap."""
+        if self.outbox is None or time.monotonic() < self._next_replay:
+            return
+        pending = await asyncio.to_thread(self.outbox.pending, self.replay_batch_limit, set(self._queued_ids))
+        if not pending:
+            self._next_replay = time.monotonic() + 1.0
+            return
+        records = [record for _, batch in pending for record in batch]
+        status = await self.post(records)
+        if status is not None and status < 500 and status != 429:
+            await asyncio.to_thread(self.outbox.mark_delivered, [i for i, _ in pending], status)
+            self.batches_replayed += len(pending)
+            self._next_replay = time.monotonic() + len(records) / self.replay_records_per_second
+        else:
+            self._next_replay = time.monotonic() + self.replay_retry_seconds
+
+    async def stop(self, timeout=10):
+        """Send what is still queued (up to `timeout` seconds) and stop the task; the rest stays in the outbox."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+            await self._post_features()
+        except asyncio.TimeoutError:
+            print(f"[WARN] Sender stopped with {self._queue.qsize()} batches still queued")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches_sent": self.batches_sent,
+            "batches_failed": self.batches_failed,
+            "batches_dropped": self.batches_dropped,
+            "batches_replayed": self.batches_replayed,
+            "outbox_pending": self.outbox.pending_count() if self.outbox is not None else None,
+            "features_sent": self.features_sent,
+            "last_latency": self.last_latency,
+            "wire_format": self.wire_format,
+            "payload_bytes": self.payload_bytes,
+        }
+
+
+class AsyncFaceReaderConnector:
+    """
+    asyncio version of FaceReaderConnector.
+
+    Built on asyncio streams and an aiohttp client session, so one event
+    loop can drive many FaceReader connections and their uploads without a
+    thread per connection. Pass the same `http` session and `sender` to
+    several connectors to share one upload pipeline; records pushed by a
+    connector with a `station_id`/`participant_id` are tagged with them.
+    Batches are cut by `push_policy` (default: a PushPolicy starting at
+    `offset_send_seconds`); with `upload_fps` the upload is decimated to
+    that rate while the session log keeps every frame.
+    """
+
+    def __init__(self, host=None, port=None, server_url=None, log_dir='logs', http=None,
+                 offset_send_seconds=1, stream_poll_seconds=0.5, sender=None,
+                 station_id=None, participant_id=None, push_policy=None, upload_fps=None, log_archive=None):
+        self.host = host
+        self.port = port
+        self.server_url = server_url.strip().rstrip("/") if server_url else server_url
+        self.log_dir = log_dir
+        os.makedirs(self.log_dir, exist_ok=True)
+        # Session logs are rotated, compressed and expired by the (possibly shared) archive
+        self.log_archive = log_archive or SessionLogArchive(self.log_dir)
+        self.reader = None
+        self.writer = None
+        # Replies are matched to their ActionMessage by <Id>; one task reads the stream at a time
+        self.responses = ResponseRouter()
+        self._read_lock = asyncio.Lock()
+        self.response_timeout = 10
+        self.http = http
+        self._owns_http = http is None
+        self.offset_send_seconds = offset_send_seconds
+        self.push_policy = push_policy or PushPolicy(initial_interval=offset_send_seconds)
+        self.stream_poll_seconds = stream_poll_seconds
+        self.upload_fps = upload_fps
+        self.log_enabled_global = False
+        # Set by stop_session to end the classifications() iterator
+        self._stop_streaming = False
+        self.session_id = None
+        self.session_stats = {"frames_received": 0, "frames_dropped": 0}
+        self.emotion_window = EmotionWindowAggregator()
+        self.emotion_features = EmotionFeatureEngine()
+        self.sender = sender
+        self.station_id = station_id
+        self.participant_id = participant_id
+
+    def _http(self):
+        if self.http is None:
+            self.http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=20),
+                timeout=aiohttp.ClientTimeout(sock_connect=3.05, sock_read=10),
+            )
+        return self.http
+
+    ### CONNECTION
+    async def connect(self):
+        """Establish a connection to the FaceReader server."""
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        print(f"Connected to FaceReader {self.host}:{self.port}.")
+
+    async def disconnect(self):
+        """Close the FaceReader connection and, if owned, the HTTP session."""
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            self.reader = self.writer = None
+            print(f"Disconnected from FaceReader {self.host}:{self.port}.")
+        self.responses.fail_all(ConnectionError("Disconnected from FaceReader"))
+        if self._owns_http and self.http is not None:
+            await self.http.close()
+            self.http = None
+
+    async def send_action_message(self, action_type: str, msg_id: str = None, information: list[str] = None):
+        """Send an action message (e.g., start analyzing, request stimuli) without waiting; returns its Id."""
+        msg_id = msg_id or self.responses.next_id()
+        self.writer.write(build_action_packet(action_type, msg_id, information))
+        await self.writer.drain()
+        print(f"Sent: {action_type}")
+        return msg_id
+
+    async def request_action(self, action_type: str, information: list[str] = None):
+        """Send an action message and return a future resolved with the ResponseMessage echoing its Id."""
+        future = asyncio.get_running_loop().create_future()
+        msg_id = self.responses.register(action_type, future)
+        try:
+            await self.send_action_message(action_type, msg_id, information)
+        except OSError:
+            self.responses.discard(msg_id)
+            raise
+        return future
+
+    async def wait_reply(self, future, timeout=None):
+        """
+        Result of a request_action future. While a session reads the stream
+        this just waits; otherwise this task reads and dispatches messages
+        until the reply arrives. Raises asyncio.TimeoutError after `timeout`.
+        """
+        timeout = self.response_timeout if timeout is None else timeout
+        if self._read_lock.locked():
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        deadline = asyncio.get_running_loop().time() + timeout
+        async with self._read_lock:
+            while not future.done():
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                try:
+                    # Anything that is not a reply is not claimed outside a session
+                    if await self.read_message(min(remaining, self.stream_poll_seconds)) is None:
+                        raise ConnectionError("Connection closed while waiting for a reply")
+                except asyncio.TimeoutError:
+                    continue
+        return future.result()
+
+    async def score_stimulus(self, name):
+        """Mark the start of a stimulus in the FaceReader analysis; returns the reply future."""
+        return await self.request_action("FaceReader_Score_Stimulus", [name])
+
+    async def score_event_marker(self, name):
+        """Mark an event in the FaceReader analysis; returns the reply future."""
+        return await self.request_action("FaceReader_Score_EventMarker", [name])
+
+    async def read_message(self, timeout=None):
+        """
+        Read the next message that is not a reply and return (type_name, xml
+        bytes), or None if the connection closed. Replies met on the way are
+        dispatched to their futures. With `timeout`, asyncio.TimeoutError is
+        raised if no header arrives in time.
+        """
+        while True:
+            message = await self._read_frame(timeout)
+            if message is None or not self.responses.is_response(message[0]):
+                return message
+            self.responses.dispatch(message[1])
+
+    async def _read_frame(self, timeout=None):
+        """
+        Read one framed message and return (type_name, xml bytes), or None if
+        the connection closed. With `timeout`, asyncio.TimeoutError is raised
+        if no header arrives in time; nothing is consumed from the stream then.
+        """
+        try:
+            if timeout is None:
+                header = await self.reader.readexactly(4)
+            else:
+                header = await asyncio.wait_for(self.reader.readexactly(4), timeout)
+            total_len = struct.unpack('<I', header)[0]
+            payload = await self.reader.readexactly(total_len - 4)
+        except asyncio.IncompleteReadError:
+            return None
+        type_len = struct.unpack('<I', payload[:4])[0]
+        return payload[4:4 + type_len].decode('utf-8', errors='replace'), payload[4 + type_len:]
+
+    async def read_response(self):
+        """Read until the next ResponseMessage and return it parsed (other messages are skipped)."""
+        while True:
+            message = await self._read_frame()
+            if message is None:
+                return None
+            if self.responses.is_response(message[0]):
+                return self.responses.dispatch(message[1])
+
+    ### STREAMING
+    async def classifications(self):
+        """
+        Async iterator over ClassificationRecords, usable on its own or
+        through start_session. Detailed log sending is enabled once on entry
+        and disabled when iteration ends: on stop_session(), aclose() or a
+        closed connection.
+        """
+        self._stop_streaming = False
+        await self._read_lock.acquire()
+        try:
+            await self.send_action_message("FaceReader_Start_DetailedLogSending")
+            while not self._stop_streaming:
+                try:
+                    message = await self.read_message(self.stream_poll_seconds)
+                except asyncio.TimeoutError:
+                    continue
+                if message is None:
+                    print("Connection closed.")
+                    return
+                try:
+                    record = parse_classification(message[1])
+                except ValueError as e:
+                    print("XML parsing error:", e)
+                    continue
+                if record is not None:
+                    self._count_frame(record)
+                    yield record
+        finally:
+            self._read_lock.release()
+            if self.writer is not None and not self.writer.is_closing():
+                await self.send_action_message("FaceReader_Stop_DetailedLogSending")
+
+    def _count_frame(self, record):
+        self.session_stats["frames_received"] += 1
+        self.session_stats["last_frame_time"] = time.monotonic()
+        frame = record.frame_number
+        if frame is None:
+            return
+        last_frame = self.session_stats.get("last_frame")
+        if last_frame is not None and frame > last_frame + 1:
+            self.session_stats["frames_dropped"] += frame - last_frame - 1
+        self.session_stats["last_frame"] = frame
+
+    ### SESSION
+    async def start_session(self):
+        """
+        Start analyzing, stream classifications into the session log and the
+        push window, and upload a batch whenever the push policy asks for
+        one, until stop_session is called.
+        """
+        try:
+            await self.wait_reply(await self.request_action("FaceReader_Start_Analyzing"))
+        except asyncio.TimeoutError:
+            print("No reply to FaceReader_Start_Analyzing, continuing.")
+        self.log_enabled_global = True
+        self.session_id = uuid.uuid4().hex
+        self.session_stats = {"frames_received": 0, "frames_dropped": 0, "last_frame": None,
+                              "started": time.monotonic()}
+        self.emotion_window = EmotionWindowAggregator(session_id=self.session_id, upload_fps=self.upload_fps)
+        self.emotion_features.reset()
+        csv_path = os.path.join(self.log_dir, f"data_{datetime.now().timestamp()}.csv")
+        owns_sender = self.sender is None
+        if owns_sender:
+            self.sender = AsyncEmotionSender(self.server_url + "/submit_emotion", self._http,
+                                             policy=self.push_policy,
+                                             features_url=self.server_url + "/submit_features",
+                                             outbox=EmotionOutbox(os.path.join(self.log_dir, "outbox.sqlite3")))
+            self.sender.start()
+        self.log_archive.sweep()
+        writer = RotatingSessionLog(csv_path, self.log_archive)
+        try:
+            async for record in self.classifications():
+                timestamp_actual = datetime.now().timestamp()
+                writer.write_record(record, timestamp_actual)
+                self.emotion_window.add(record, timestamp_actual)
+                self.emotion_features.update(record, timestamp_actual)
+                oldest = self.emotion_window.oldest_timestamp()
+                if self.push_policy.should_flush(len(self.emotion_window),
+                                                 timestamp_actual - oldest if oldest is not None else 0.0):
+                    await self.push_to_server(timestamp_actual)
+            await self.push_to_server(datetime.now().timestamp())
+        finally:
+            writer.close()
+            if owns_sender:
+                await self.sender.stop()
+                self.sender.outbox.close()
+                self.sender = None
+            print(f"Frames received: {self.session_stats['frames_received']}, "
+                  f"dropped: {self.session_stats['frames_dropped']}")
+
+    async def stop_session(self):
+        await self.send_action_message("FaceReader_Stop_Analyzing")
+        self.log_enabled_global = False
+        self._stop_streaming = True
+
+    ### UPLOAD
+    async def push_to_server(self, timestamp_end):
+        """Queue the frames aggregated up to `timestamp_end` for the sender."""
+        batch = self.emotion_window.drain(timestamp_end)
+        if not batch:
+            return
+        if self.station_id is not None or self.participant_id is not None:
+            for record in batch:
+                record['station_id'] = self.station_id
+                record['participant_id'] = self.participant_id
+        await self.sender.submit(batch)
+        # Rolling features go to their own endpoint, so every record keeps the same keys
+        features = {"session_id": self.session_id, "features": self.emotion_features.snapshot()}
+        if self.station_id is not None or self.participant_id is not None:
+            features['station_id'] = self.station_id
+            features['participant_id'] = self.participant_id
+        self.sender.submit_features(features)
+
+    ### SERVER CALLS
+    async def set_log_dir(self, user_name):
+        self.log_dir = f"logs/{user_name}"
+        os.makedirs(self.log_dir, exist_ok=True)
+        async with self._http().post(self.server_url + "/set_current_user", json={"user_name": user_name}) as response:
+            return response.status
+
+    async def set_stimuli(self, stimuli):
+        async with self._http().post(self.server_url + "/set_current_stimuli", json={"stimuli": stimuli}) as response:
+            return (await response.json())["log"]
+
+    async def aggregate_emotions(self, local=False):
+        """Session aggregate from the server, or from the client-side features with local=True."""
+        if local:
+            return self.emotion_features.summary()
+        async with self._http().get(self.server_url + "/aggregate_emotions") as response:
+            to_return = (await response.json())["log"]
+        async with self._http().post(self.server_url + "/submit_chat_log", json={"VALUE": "Emotions Aggregated for Prompt", "LOGTYPE": "EMOTIONS_AGGREGATED", "mode": "emotion conditioning"}):
+            pass
+        return to_return
+
+    async def restart_server(self):
+        async with self._http().get(self.server_url + "/restart_chat") as response:
+            return (await response.json())["url"]
+
+
+async def main(config_data, seconds=4):
+    connector = AsyncFaceReaderConnector(
+        host=config_data["HOST"],
+        port=config_data["PORT"],
+        server_url=config_data["SERVER_URL"],
+        log_dir='logs'
+    )
+    await connector.connect()
+    session = asyncio.create_task(connector.start_session())
+    await asyncio.sleep(seconds)
+    await connector.stop_session()
+    await session
+    await connector.disconnect()
+
+
+if __name__ == '__main__':
+    import json
+    asyncio.run(main(json.load(open("config.json"))))
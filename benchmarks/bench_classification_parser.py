@@ -0,0 +1,58 @@
+"""
+Classification parsing: ElementTree + find/findall (previous path of
+log_classification_to_csv) against parse_classification, a single scan
+of the raw frame bytes with compiled byte regexes.
+
+    python benchmarks/bench_classification_parser.py
+"""
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from facereader_protocol import parse_classification
+from facereader_simulator import classification_xml
+
+
+def parse_element_tree(xml_data):
+    root = ET.fromstring(xml_data)
+    frame = root.find("FrameNumber").text if root.find("FrameNumber") is not None else "?"
+    ticks = root.find("FrameTimeTicks").text if root.find("FrameTimeTicks") is not None else "?"
+    rows = []
+    for val in root.findall(".//ClassificationValue"):
+        label = val.find("Label").text if val.find("Label") is not None else "?"
+        typ = val.find("Type").text
+        if typ == "Value":
+            value = val.find("Value/float")
+            rows.append((frame, ticks, label, typ, value.text if value is not None else ""))
+        elif typ == "State":
+            state = val.find("State/string")
+            rows.append((frame, ticks, label, typ, state.text if state is not None else ""))
+    return rows
+
+
+def bench(func, messages, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for message in messages:
+            func(message)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == '__main__':
+    frames = 2000
+    messages = [classification_xml(i).encode('utf-8') for i in range(frames)]
+
+    # Both paths must read the same fields
+    record = parse_classification(messages[0])
+    assert len(record.values) == len(parse_element_tree(messages[0]))
+
+    t_et = bench(parse_element_tree, messages)
+    t_fast = bench(parse_classification, messages)
+    print(f"ElementTree + find : {t_et / frames * 1e6:8.1f} us/frame")
+    print(f"parse_classification: {t_fast / frames * 1e6:8.1f} us/frame")
+    print(f"speedup            : {t_et / t_fast:8.2f}x")
@@ -0,0 +1,103 @@
+"""
+Dominant-emotion computation on a synthetic 1-hour session (30 fps):
+pandas groupby/idxmax + iterrows (previous push_to_server) against the
+wide per-frame emotion matrix with a single argmax.
+
+    python benchmarks/bench_emotion_window.py [minutes] [fps]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from emotion_window import EMOTIONS, EmotionWindowAggregator, dominant_emotion_records, wide_frame_matrix
+from facereader_protocol import ClassificationRecord
+
+
+def synthetic_session(minutes, fps, seed=0):
+    """Long-format session log as written by SessionLogWriter, plus the parsed records."""
+    rng = np.random.default_rng(seed)
+    frames = minutes * 60 * fps
+    labels = EMOTIONS + ['Valence', 'Arousal']
+    values = rng.random((frames, len(labels)))
+    values[:, -2] = values[:, -2] * 2 - 1
+    timestamps = 1.7e9 + np.arange(frames) / fps
+    df = pd.DataFrame({
+        'Frame': np.repeat(np.arange(frames), len(labels)),
+        'FrameTicks': np.repeat(np.arange(frames) * 333333, len(labels)),
+        'Feature': np.tile(labels, frames),
+        'Attribute': 'Value',
+        'Value': values.ravel(),
+        'Timestamp': np.repeat(timestamps, len(labels)),
+    })
+    records = [ClassificationRecord(i, i * 333333, [(label, "Value", v) for label, v in zip(labels, row)])
+               for i, row in enumerate(values.tolist())]
+    return df, records, timestamps
+
+
+def previous_push_records(df, timestamp_start, timestamp_end):
+    """The groupby('Frame').idxmax() + iterrows path of the old push_to_server."""
+    df = df.copy()
+    df['Timestamp'] = pd.to_numeric(df['Timestamp'], errors='coerce')
+    df['Value'] = pd.to_numeric(df['Value'], errors='coerce')
+    df_win = df[(df['Timestamp'] >= timestamp_start) & (df['Timestamp'] <= timestamp_end)].copy()
+    emotion_df = df_win[
+        (df_win['Attribute'] == 'Value') &
+        (df_win['Feature'].isin(EMOTIONS)) &
+        (df_win['Value'].notna())
+    ].copy()
+    idx = emotion_df.groupby('Frame')['Value'].idxmax()
+    dom_per_frame = emotion_df.loc[idx].copy().sort_values(['Timestamp', 'Frame'])
+
+    def per_frame_lookup(feature_name):
+        tmp = df_win[(df_win['Feature'] == feature_name) & (df_win['Attribute'] == 'Value')].copy()
+        tmp = tmp.dropna(subset=['Value'])
+        tmp = tmp.sort_values(['Frame', 'Timestamp']).groupby('Frame', as_index=False).tail(1)
+        return dict(zip(tmp['Frame'], tmp['Value']))
+
+    valence_map = per_frame_lookup('Valence')
+    arousal_map = per_frame_lookup('Arousal')
+    out = []
+    for _, r in dom_per_frame.iterrows():
+        frame_id = r['Frame']
+        out.append({
+            'frame': int(frame_id),
+            'emotion': r['Feature'],
+            'intensity': float(r['Value']),
+            'valence': float(valence_map[frame_id]) if frame_id in valence_map else None,
+            'arousal': float(arousal_map[frame_id]) if frame_id in arousal_map else None,
+            'timestamp_actual': float(r['Timestamp']),
+        })
+    return out
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    minutes = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    fps = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    df, records, timestamps = synthetic_session(minutes, fps)
+    print(f"{len(records)} frames, {len(df)} log rows")
+
+    t_old, old = timed(previous_push_records, df, timestamps[0], timestamps[-1])
+    t_wide, new = timed(lambda: dominant_emotion_records(*wide_frame_matrix(df)))
+
+    def ring():
+        window = EmotionWindowAggregator(max_frames=len(records))
+        for record, timestamp in zip(records, timestamps.tolist()):
+            window.add(record, timestamp)
+        return window.drain()
+    t_ring, ring_out = timed(ring)
+
+    assert [r['emotion'] for r in old] == [r['emotion'] for r in new] == [r['emotion'] for r in ring_out]
+    print(f"pandas groupby + iterrows       : {t_old:8.3f} s")
+    print(f"wide matrix argmax (from log)   : {t_wide:8.3f} s  ({t_old / t_wide:.1f}x)")
+    print(f"ring buffer add + drain (live)  : {t_ring:8.3f} s  (add {t_ring / len(records) * 1e6:.1f} us/frame)")
@@ -0,0 +1,52 @@
+"""
+/submit_emotion wire formats: payload bytes per record and encode time
+per batch for JSON and the columnar encoding, uncompressed, gzip and (if
+zstandard is installed) zstd.
+
+    python benchmarks/bench_wire_format.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from emotion_codec import decode_batch, encode_batch, zstandard
+from emotion_window import EmotionWindowAggregator
+from facereader_protocol import parse_classification
+from facereader_simulator import classification_xml
+
+
+def make_batch(frames, seed=0):
+    rng = random.Random(seed)
+    window = EmotionWindowAggregator(session_id="bench")
+    start = time.time()
+    for i in range(frames):
+        window.add(parse_classification(classification_xml(i, rng=rng)), start + i / 30)
+    return window.drain()
+
+
+def bench(batch, wire_format, compression, repeat=20):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body, headers = encode_batch(batch, wire_format, compression)
+        best = min(best, time.perf_counter() - start)
+    # Round trip must give the same records back
+    assert len(decode_batch(body, headers["Content-Type"], headers.get("Content-Encoding"))) == len(batch)
+    return len(body), best
+
+
+if __name__ == '__main__':
+    compressions = [None, "gzip"] + (["zstd"] if zstandard is not None else [])
+    for frames in (30, 300):
+        batch = make_batch(frames)
+        baseline = None
+        print(f"batch of {frames} records")
+        for wire_format in ("json", "columnar"):
+            for compression in compressions:
+                size, seconds = bench(batch, wire_format, compression)
+                baseline = baseline or size
+                print(f"  {wire_format:>8} {str(compression):>5}: {size / frames:7.1f} B/record "
+                      f"({baseline / size:5.1f}x)  encode {seconds * 1e3:6.3f} ms/batch")
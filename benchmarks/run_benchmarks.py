@@ -0,0 +1,203 @@
+"""
+Benchmark suite for the connector hot paths.
+
+Each stage is run over the frames of simulated sessions (fps x subjects x
+minutes) and its CPU cost is reported per frame and as `load`, the
+fraction of one core the stage needs to keep up in real time:
+
+    framing    build_packet + FrameDecoder over a coalesced byte stream
+    parse      parse_classification
+    log        SessionLogWriter.write_record
+    aggregate  EmotionWindowAggregator.add + drain once per second
+    upload     EmotionSender.post of one batch per subject per second to a
+               local stub ingest server (capped by --max-upload-batches)
+
+Results are written as JSON so runs can be compared between commits:
+
+    python benchmarks/run_benchmarks.py --fps 30 60 --subjects 1 2 4 --minutes 1 10 60 -o bench.json
+"""
+import argparse
+import http.server
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from emotion_window import EmotionWindowAggregator
+from facereader_protocol import FrameDecoder, build_packet, parse_classification
+from facereader_simulator import CLASSIFICATION_TYPE, classification_xml
+from push_pipeline import EmotionSender
+from session_log import SessionLogWriter
+
+POOL_SIZE = 256
+
+
+class _StubIngest(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+def stub_ingest_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _StubIngest)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def message_pool(seed=0):
+    rng = random.Random(seed)
+    return [classification_xml(i, rng=rng) for i in range(POOL_SIZE)]
+
+
+def bench_framing(pool, frames):
+    packets = [build_packet(CLASSIFICATION_TYPE, xml) for xml in pool]
+    chunk = b"".join(packets)
+    decoder = FrameDecoder()
+    start = time.process_time()
+    for i in range(frames):
+        build_packet(CLASSIFICATION_TYPE, pool[i % POOL_SIZE])
+    decoded = 0
+    while decoded < frames:
+        decoder.feed(chunk)
+        while decoder.next_buffered_frame() is not None:
+            decoded += 1
+    return time.process_time() - start
+
+
+def bench_parse(pool, frames):
+    raw = [xml.encode('utf-8') for xml in pool]
+    start = time.process_time()
+    for i in range(frames):
+        parse_classification(raw[i % POOL_SIZE])
+    return time.process_time() - start
+
+
+def bench_log(records, frames, fps):
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = SessionLogWriter(os.path.join(tmp, "data.csv"))
+        start = time.process_time()
+        for i in range(frames):
+            writer.write_record(records[i % POOL_SIZE], i / fps)
+        writer.close()
+        return time.process_time() - start
+
+
+def bench_aggregate(records, frames, fps, subjects):
+    windows = [EmotionWindowAggregator(session_id=str(s)) for s in range(subjects)]
+    start = time.process_time()
+    for i in range(frames):
+        subject = i % subjects
+        timestamp = i // subjects / fps
+        windows[subject].add(records[i % POOL_SIZE]._replace(frame_number=i // subjects), timestamp)
+        if subject == subjects - 1 and (i // subjects + 1) % fps == 0:
+            for window in windows:
+                window.drain(timestamp)
+    return time.process_time() - start
+
+
+def bench_upload(records, fps, batches, url):
+    window = EmotionWindowAggregator(session_id="bench")
+    for i in range(fps):
+        window.add(records[i % POOL_SIZE]._replace(frame_number=i), i / fps)
+    batch = window.drain()
+    sender = EmotionSender(url, max_attempts=1)
+    latencies = []
+    start = time.process_time()
+    for _ in range(batches):
+        sent = time.perf_counter()
+        sender.post(batch)
+        latencies.append(time.perf_counter() - sent)
+    return time.process_time() - start, latencies
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(fps_list, subjects_list, minutes_list, max_upload_batches):
+    pool = message_pool()
+    records = [parse_classification(xml) for xml in pool]
+    server, url = stub_ingest_server()
+    results = []
+    try:
+        for fps in fps_list:
+            for subjects in subjects_list:
+                for minutes in minutes_list:
+                    session_seconds = minutes * 60
+                    frames = fps * session_seconds * subjects
+                    stages = {
+                        "framing": bench_framing(pool, frames),
+                        "parse": bench_parse(pool, frames),
+                        "log": bench_log(records, frames, fps),
+                        "aggregate": bench_aggregate(records, frames, fps, subjects),
+                    }
+                    for stage, seconds in stages.items():
+                        results.append({
+                            "stage": stage, "fps": fps, "subjects": subjects, "minutes": minutes,
+                            "frames": frames, "cpu_seconds": seconds,
+                            "us_per_frame": seconds / frames * 1e6,
+                            "load": seconds / session_seconds,
+                        })
+                    total_batches = session_seconds * subjects
+                    batches = min(total_batches, max_upload_batches)
+                    seconds, latencies = bench_upload(records, fps, batches, url)
+                    results.append({
+                        "stage": "upload", "fps": fps, "subjects": subjects, "minutes": minutes,
+                        "frames": frames, "batches": batches, "cpu_seconds": seconds,
+                        "us_per_frame": seconds / (batches * fps) * 1e6,
+                        "load": seconds / batches * total_batches / session_seconds,
+                        "latency_p50_ms": statistics.median(latencies) * 1e3,
+                        "latency_p95_ms": sorted(latencies)[int(0.95 * (len(latencies) - 1))] * 1e3,
+                    })
+                    for result in results[-5:]:
+                        print(f"{result['stage']:>9} fps={fps:<3} subjects={subjects:<3} minutes={minutes:<3} "
+                              f"{result['us_per_frame']:8.2f} us/frame  load={result['load']:.4f}")
+    finally:
+        server.shutdown()
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Connector hot path benchmarks")
+    parser.add_argument("--fps", type=int, nargs="+", default=[30, 60])
+    parser.add_argument("--subjects", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--minutes", type=int, nargs="+", default=[1, 10, 60],
+                        help="session lengths; frames are streamed, so long sessions cost time, not memory")
+    parser.add_argument("--max-upload-batches", type=int, default=100)
+    parser.add_argument("-o", "--output", default="bench_output.json")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    results = run(args.fps, args.subjects, args.minutes, args.max_upload_batches)
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.time(),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=1)
+    print(f"Results written to {args.output}")
@@ -0,0 +1,95 @@
+import concurrent.futures
+
+
+class Command:
+    """
+    Handle of one submitted command. Exactly one of `on_done(result)` or
+    `on_error(exception)` is called, on the UI thread: the error is a
+    concurrent.futures.TimeoutError once `timeout` has passed, or a
+    CancelledError after `cancel()`.
+    """
+
+    def __init__(self, executor, key, on_done, on_error):
+        self.executor = executor
+        self.key = key
+        self.on_done = on_done
+        self.on_error = on_error
+        self.future = None
+        self.finished = False
+
+    def cancel(self):
+        """Stop waiting for the command; it is also dropped if it has not started yet."""
+        if self.future is not None:
+            self.future.cancel()
+        self._finish(None, concurrent.futures.CancelledError())
+
+    def _complete(self):
+        if self.future.cancelled():
+            self._finish(None, concurrent.futures.CancelledError())
+        elif self.future.exception() is not None:
+            self._finish(None, self.future.exception())
+        else:
+            self._finish(self.future.result(), None)
+
+    def _time_out(self):
+        self._finish(None, concurrent.futures.TimeoutError())
+
+    def _finish(self, result, error):
+        # Runs on the UI thread, so the first outcome wins without locking
+        if self.finished:
+            return
+        self.finished = True
+        self.executor._forget(self)
+        if error is None:
+            if self.on_done is not None:
+                self.on_done(result)
+        elif self.on_error is not None:
+            self.on_error(error)
+
+
+class CommandExecutor:
+    """
+    Runs blocking connector calls (sockets, HTTP) on a small thread pool so
+    that UI callbacks return at once.
+
+    `submit` returns a Command wrapping the Future; its outcome is delivered
+    through `schedule(func, delay)`, which must run `func` on the UI thread
+    (Clock.schedule_once by default). A running call cannot be interrupted:
+    on timeout or cancel its late result is discarded. Commands submitted
+    with a `key` are not started twice: while one is pending, submitting the
+    same key returns it.
+    """
+
+    def __init__(self, max_workers=4, schedule=None):
+        if schedule is None:
+            from kivy.clock import Clock
+
+            def schedule(func, delay=0):
+                Clock.schedule_once(lambda dt: func(), delay)
+        self._schedule = schedule
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="Command")
+        self._pending = {}
+
+    def submit(self, func, *args, on_done=None, on_error=None, timeout=None, key=None, **kwargs):
+        if key is not None and key in self._pending:
+            return self._pending[key]
+        command = Command(self, key, on_done, on_error)
+        self._pending[key if key is not None else id(command)] = command
+        command.future = self._pool.submit(func, *args, **kwargs)
+        command.future.add_done_callback(lambda future: self._schedule(command._complete, 0))
+        if timeout is not None:
+            self._schedule(command._time_out, timeout)
+        return command
+
+    def _forget(self, command):
+        self._pending.pop(command.key if command.key is not None else id(command), None)
+
+    def pending(self):
+        return list(self._pending.values())
+
+    def cancel_all(self):
+        for command in self.pending():
+            command.cancel()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
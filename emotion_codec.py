@@ -0,0 +1,173 @@
+"""
+Wire formats for /submit_emotion batches.
+
+"json" is the original encoding, a JSON list of record dicts. "columnar"
+sends one array per key instead of repeating the keys in every record:
+
+    {"format": "emotion-columns", "version": 1, "count": n, "keys": [...],
+     "constants": {key: value},            # same value in every record
+     "codes": {"emotion": [0, 1, ...]},    # index in EMOTION_CODES
+     "deltas": {"frame": [first, d1, ...]},
+     "scaled_deltas": {"timestamp_actual": [1e6, first, d1, ...]},
+     "columns": {key: [...]}}              # anything else, as is
+
+Integer columns (frame, seq) are delta encoded, timestamps are delta
+encoded in integer microseconds. A column that does not fit (None values,
+unknown emotion) is sent as a plain array. Either format can be gzip or
+zstd compressed (zstd needs the optional `zstandard` package); the format
+is given by the Content-Type header and the compression by
+Content-Encoding. `decode_batch` is the reference decoder for the server.
+"""
+import gzip
+import json
+import math
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Fixed code table, shared with the server: append only
+EMOTION_CODES = ['Neutral', 'Happy', 'Sad', 'Angry', 'Surprised', 'Scared', 'Disgusted']
+_EMOTION_INDEX = {emotion: i for i, emotion in enumerate(EMOTION_CODES)}
+
+JSON_CONTENT_TYPE = "application/json"
+COLUMNAR_CONTENT_TYPE = "application/vnd.emotion-columns+json"
+COMPRESSIONS = (None, "gzip", "zstd")
+_SCALES = {"timestamp_actual": 1_000_000}
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_number(value):
+    return (_is_int(value) or isinstance(value, float)) and math.isfinite(value)
+
+
+def finite(value):
+    """`value` with every NaN or infinite float (in nested dicts and lists too) replaced by None."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [finite(item) for item in value]
+    return value
+
+
+def _deltas(values):
+    return [values[0]] + [b - a for a, b in zip(values, values[1:])]
+
+
+def _undeltas(deltas):
+    values = []
+    total = 0
+    for delta in deltas:
+        total += delta
+        values.append(total)
+    return values
+
+
+def columnar(records):
+    """Columnar document for a list of record dicts."""
+    keys = []
+    seen = set()
+    for record in records:
+        for key in record:
+            if key not in seen:
+                seen.add(key)
+                keys.append(key)
+    document = {"format": "emotion-columns", "version": 1, "count": len(records), "keys": keys,
+                "constants": {}, "codes": {}, "deltas": {}, "scaled_deltas": {}, "columns": {}}
+    missing = object()
+    for key in keys:
+        values = [record.get(key, missing) for record in records]
+        if any(value is missing for value in values):
+            document["columns"][key] = [None if value is missing else value for value in values]
+        elif len(records) > 1 and all(value == values[0] for value in values):
+            document["constants"][key] = values[0]
+        elif key == "emotion" and all(value in _EMOTION_INDEX for value in values):
+            document["codes"][key] = [_EMOTION_INDEX[value] for value in values]
+        elif key in _SCALES and all(_is_number(value) for value in values):
+            scale = _SCALES[key]
+            document["scaled_deltas"][key] = [scale] + _deltas([round(value * scale) for value in values])
+        elif all(_is_int(value) for value in values):
+            document["deltas"][key] = _deltas(values)
+        else:
+            document["columns"][key] = values
+    return document
+
+
+def records_from_columnar(document):
+    """Inverse of `columnar` (timestamps are rounded to the microsecond)."""
+    if document.get("format") != "emotion-columns" or document.get("version") != 1:
+        raise ValueError("Not an emotion-columns v1 document")
+    count = document["count"]
+    columns = {}
+    for key, value in document["constants"].items():
+        columns[key] = [value] * count
+    for key, codes in document["codes"].items():
+        columns[key] = [EMOTION_CODES[code] for code in codes]
+    for key, deltas in document["deltas"].items():
+        columns[key] = _undeltas(deltas)
+    for key, deltas in document["scaled_deltas"].items():
+        scale = deltas[0]
+        columns[key] = [value / scale for value in _undeltas(deltas[1:])]
+    columns.update(document["columns"])
+    keys = document["keys"]
+    return [{key: columns[key][i] for key in keys} for i in range(count)]
+
+
+def compress(data, compression):
+    if compression is None:
+        return data
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def decompress(data, compression):
+    if not compression or compression == "identity":
+        return data
+    if compression == "gzip":
+        return gzip.decompress(data)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def encode_batch(records, wire_format="json", compression=None):
+    """
+    Request body and headers for a batch of /submit_emotion records. NaN and
+    infinite values are sent as null, since JSON has no literal for them.
+    """
+    records = finite(records)
+    if wire_format == "columnar":
+        content_type = COLUMNAR_CONTENT_TYPE
+        document = columnar(records)
+    elif wire_format == "json":
+        content_type = JSON_CONTENT_TYPE
+        document = records
+    else:
+        raise ValueError(f"Unknown wire format: {wire_format}")
+    body = json.dumps(document, separators=(',', ':'), allow_nan=False).encode('utf-8')
+    headers = {"Content-Type": content_type}
+    if compression is not None:
+        body = compress(body, compression)
+        headers["Content-Encoding"] = compression
+    return body, headers
+
+
+def decode_batch(body, content_type=JSON_CONTENT_TYPE, content_encoding=None):
+    """Records from a request body, for either wire format."""
+    document = json.loads(decompress(body, content_encoding))
+    if content_type.split(";")[0].strip() == COLUMNAR_CONTENT_TYPE:
+        return records_from_columnar(document)
+    return document
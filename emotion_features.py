@@ -0,0 +1,152 @@
+import math
+from collections import deque
+
+from emotion_window import EMOTIONS
+
+
+class _WindowStats:
+    """Mean and variance of the last `size` values, from running sums."""
+
+    def __init__(self, size):
+        self.values = deque(maxlen=size)
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def add(self, value):
+        if len(self.values) == self.values.maxlen:
+            old = self.values[0]
+            self.total -= old
+            self.total_sq -= old * old
+        self.values.append(value)
+        self.total += value
+        self.total_sq += value * value
+
+    def snapshot(self):
+        n = len(self.values)
+        if not n:
+            return {"mean": None, "var": None, "n": 0}
+        mean = self.total / n
+        return {"mean": mean, "var": max(0.0, self.total_sq / n - mean * mean), "n": n}
+
+
+class EmotionFeatureEngine:
+    """
+    Streaming per-session emotion features, updated in O(1) per frame.
+
+    - `ema`: exponentially smoothed intensity of each emotion, with a time
+      constant of `half_life_seconds` (frames arriving late or in bursts
+      weigh by their spacing, not by their count);
+    - `valence` / `arousal`: mean and variance over the last
+      `window_frames` frames;
+    - the dominant emotion (argmax of the raw intensities, as in the push
+      window), how long it has been dominant, the total dwell time per
+      emotion and the count of each "From->To" transition.
+    """
+
+    def __init__(self, emotions=EMOTIONS, half_life_seconds=2.0, window_frames=300):
+        self.emotions = list(emotions)
+        self._columns = {label: i for i, label in enumerate(self.emotions)}
+        self.half_life_seconds = half_life_seconds
+        self.window_frames = window_frames
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.ema = [None] * len(self.emotions)
+        self.valence = _WindowStats(self.window_frames)
+        self.arousal = _WindowStats(self.window_frames)
+        self.dominant = None
+        self.dominant_since = None
+        self.dwell_seconds = {emotion: 0.0 for emotion in self.emotions}
+        self.transitions = {}
+        self.last_timestamp = None
+        self.last_frame = None
+
+    def update(self, record, timestamp_actual):
+        """
+        Fold one ClassificationRecord into the features; repeated frames and
+        NaN or infinite values (which would stay in the sums for good) are ignored.
+        """
+        frame = record.frame_number
+        if frame is not None:
+            if self.last_frame is not None and frame <= self.last_frame:
+                return
+            self.last_frame = frame
+        intensities = [None] * len(self.emotions)
+        columns = self._columns
+        for label, typ, value in record.values:
+            if typ != "Value" or value is None or not math.isfinite(value):
+                continue
+            column = columns.get(label)
+            if column is not None:
+                intensities[column] = value
+            elif label == "Valence":
+                self.valence.add(value)
+            elif label == "Arousal":
+                self.arousal.add(value)
+
+        last = self.last_timestamp
+        dt = max(0.0, timestamp_actual - last) if last is not None else 0.0
+        weight = 1.0 - math.exp(-dt * math.log(2) / self.half_life_seconds) if self.half_life_seconds else 1.0
+        ema = self.ema
+        dominant = None
+        for i, value in enumerate(intensities):
+            if value is None:
+                continue
+            ema[i] = value if ema[i] is None else ema[i] + weight * (value - ema[i])
+            if dominant is None or value > intensities[dominant]:
+                dominant = i
+
+        if self.dominant is not None and last is not None:
+            self.dwell_seconds[self.dominant] += dt
+        if dominant is not None:
+            emotion = self.emotions[dominant]
+            if emotion != self.dominant:
+                if self.dominant is not None:
+                    key = f"{self.dominant}->{emotion}"
+                    self.transitions[key] = self.transitions.get(key, 0) + 1
+                self.dominant = emotion
+                self.dominant_since = timestamp_actual
+        self.last_timestamp = timestamp_actual
+        self.frames += 1
+
+    def snapshot(self):
+        """JSON-friendly copy of the current features."""
+        return {
+            "timestamp": self.last_timestamp,
+            "frames": self.frames,
+            "ema": {emotion: value for emotion, value in zip(self.emotions, self.ema)},
+            "valence": self.valence.snapshot(),
+            "arousal": self.arousal.snapshot(),
+            "dominant": self.dominant,
+            "dominant_seconds": (self.last_timestamp - self.dominant_since
+                                 if self.dominant_since is not None else None),
+            "dwell_seconds": dict(self.dwell_seconds),
+            "transitions": dict(self.transitions),
+        }
+
+    def summary(self):
+        """Plain text summary of the session so far, in the style of /aggregate_emotions."""
+        if not self.frames:
+            return "No emotions received yet."
+        total = sum(self.dwell_seconds.values()) or 1.0
+        dwell = ", ".join(f"{emotion} {seconds / total:.0%}"
+                          for emotion, seconds in sorted(self.dwell_seconds.items(), key=lambda item: -item[1])
+                          if seconds > 0)
+        smoothed = ", ".join(f"{emotion} {value:.2f}" for emotion, value in zip(self.emotions, self.ema)
+                             if value is not None)
+        valence = self.valence.snapshot()
+        arousal = self.arousal.snapshot()
+        lines = [f"Frames: {self.frames}"]
+        if self.dominant is not None:
+            lines.append(f"Dominant emotion: {self.dominant} for {self.last_timestamp - self.dominant_since:.1f}s")
+        lines += [
+            f"Time per dominant emotion: {dwell or '-'}",
+            f"Smoothed intensities: {smoothed}",
+            f"Transitions: {sum(self.transitions.values())}",
+        ]
+        if valence["n"]:
+            lines.append(f"Valence: mean {valence['mean']:.2f}, var {valence['var']:.3f}")
+        if arousal["n"]:
+            lines.append(f"Arousal: mean {arousal['mean']:.2f}, var {arousal['var']:.3f}")
+        return "\n".join(lines)
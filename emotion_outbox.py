@@ -0,0 +1,72 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class EmotionOutbox:
+    """
+    Crash-safe on-disk outbox for /submit_emotion batches (SQLite, WAL mode).
+
+    Every batch is stored before it is sent and marked delivered on a 2xx
+    response, or on a 4xx rejection so that a bad batch cannot block the
+    replay (the status code is kept). Batches never delivered survive
+    restarts and are returned in insertion order by `pending` for replay.
+    Delivered rows are kept for `keep_delivered_seconds` and then purged.
+    """
+
+    def __init__(self, path, keep_delivered_seconds=24 * 3600):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS batches ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " created REAL NOT NULL,"
+            " records INTEGER NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " delivered REAL,"
+            " status INTEGER)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS batches_pending ON batches (delivered, id)")
+        self._db.execute("DELETE FROM batches WHERE delivered IS NOT NULL AND delivered < ?",
+                         (time.time() - keep_delivered_seconds,))
+
+    def add(self, batch):
+        """Store a batch and return its outbox id."""
+        payload = json.dumps(batch, separators=(',', ':'))
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO batches (created, records, payload) VALUES (?, ?, ?)",
+                (time.time(), len(batch), payload),
+            )
+            return cursor.lastrowid
+
+    def mark_delivered(self, ids, status=200):
+        if not ids:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                f"UPDATE batches SET delivered = ?, status = ? WHERE id IN ({','.join('?' * len(ids))})",
+                (now, status, *ids),
+            )
+
+    def pending(self, limit=100, exclude=()):
+        """Oldest undelivered batches as (id, batch) pairs, skipping ids in `exclude`."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, payload FROM batches WHERE delivered IS NULL ORDER BY id LIMIT ?",
+                (limit + len(exclude),),
+            ).fetchall()
+        return [(i, json.loads(payload)) for i, payload in rows if i not in exclude][:limit]
+
+    def pending_count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM batches WHERE delivered IS NULL").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
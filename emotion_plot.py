@@ -0,0 +1,86 @@
+import numpy as np
+from kivy.clock import Clock
+from kivy.graphics import Color, Line, Rectangle
+from kivy.uix.label import Label
+from kivy.uix.widget import Widget
+
+# RGB per trace label; valence and arousal are drawn brighter than the emotions
+TRACE_COLORS = {
+    'Neutral': (0.7, 0.7, 0.7),
+    'Happy': (1.0, 0.85, 0.1),
+    'Sad': (0.3, 0.5, 1.0),
+    'Angry': (1.0, 0.2, 0.2),
+    'Surprised': (1.0, 0.5, 0.0),
+    'Scared': (0.7, 0.3, 1.0),
+    'Disgusted': (0.3, 0.8, 0.3),
+    'Valence': (1.0, 1.0, 1.0),
+    'Arousal': (0.0, 1.0, 1.0),
+}
+
+
+def legend_markup(labels):
+    return "  ".join(f"[color={''.join(f'{int(c * 255):02x}' for c in TRACE_COLORS.get(label, (1, 1, 1)))}]"
+                     f"{label}[/color]" for label in labels)
+
+
+class EmotionPlot(Widget):
+    """
+    Live plot of an EmotionTraceBuffer: one line per label over the
+    buffered time span, y from -1 to 1 (valence range; emotions and arousal
+    use the upper half).
+
+    Redraws run on the Kivy clock at no more than `max_fps` and only when
+    the buffer changed, and the points are decimated to the widget width in
+    pixels, so the cost of a redraw does not depend on the frame rate or
+    the session length.
+    """
+
+    def __init__(self, trace, max_fps=10, **kwargs):
+        super().__init__(**kwargs)
+        self.trace = trace
+        self._drawn = None
+        self._lines = []
+        with self.canvas:
+            Color(0.08, 0.08, 0.08)
+            self._background = Rectangle(pos=self.pos, size=self.size)
+            Color(0.3, 0.3, 0.3)
+            self._zero = Line(points=[], width=1)
+            for label in trace.labels:
+                Color(*TRACE_COLORS.get(label, (1, 1, 1)))
+                self._lines.append(Line(points=[], width=1))
+        self.bind(pos=self._resized, size=self._resized)
+        self._event = Clock.schedule_interval(self.redraw, 1.0 / max_fps)
+
+    def legend(self, **kwargs):
+        """Label with the color of each line."""
+        return Label(text=legend_markup(self.trace.labels), markup=True, **kwargs)
+
+    def _resized(self, *args):
+        self._background.pos = self.pos
+        self._background.size = self.size
+        self._zero.points = [self.x, self.center_y, self.right, self.center_y]
+        self._drawn = None
+
+    def redraw(self, dt=None):
+        version = self.trace.version
+        if version == self._drawn:
+            return
+        self._drawn = version
+        timestamps, values = self.trace.decimated(max(1, int(self.width)))
+        if len(timestamps) < 2:
+            for line in self._lines:
+                line.points = []
+            return
+        span = max(timestamps[-1] - timestamps[0], 1e-6)
+        xs = self.x + (timestamps - timestamps[0]) / span * self.width
+        ys = self.y + (np.clip(values, -1.0, 1.0) + 1.0) / 2.0 * self.height
+        for i, line in enumerate(self._lines):
+            column = ys[:, i]
+            present = ~np.isnan(column)
+            points = np.empty(2 * int(present.sum()))
+            points[0::2] = xs[present]
+            points[1::2] = column[present]
+            line.points = points.tolist()
+
+    def stop(self):
+        self._event.cancel()
@@ -0,0 +1,283 @@
+import threading
+
+import numpy as np
+
+EMOTIONS = ['Neutral', 'Happy', 'Sad', 'Angry', 'Surprised', 'Scared', 'Disgusted']
+TRACE_LABELS = EMOTIONS + ['Valence', 'Arousal']
+ACTION_UNITS = [f"Action Unit {i:02d}" for i in (1, 2, 4, 5, 6, 7, 9, 10, 12, 14, 15, 17, 18, 20, 23, 24, 25, 26, 27, 43)]
+# Every Value label FaceReader sends in a Classification
+VALUE_LABELS = TRACE_LABELS + ACTION_UNITS
+# Columns of the long-format session log (data_<ts>.csv, no header row)
+LOG_COLUMNS = ['Frame', 'FrameTicks', 'Feature', 'Attribute', 'Value', 'Timestamp']
+
+
+def dominant_emotion_records(frames, timestamps, emotion_matrix, valence, arousal, emotions=EMOTIONS):
+    """
+    Build /submit_emotion records from a wide per-frame representation.
+
+    `emotion_matrix` is a float array of shape (frames, len(emotions)) with
+    NaN for missing values; `valence` and `arousal` are per-frame float
+    columns. The dominant emotion and its intensity come from one argmax
+    over the matrix. Frames without any emotion value are skipped and the
+    records are ordered by (timestamp, frame).
+    """
+    emotion_matrix = np.asarray(emotion_matrix, dtype=float)
+    if len(emotion_matrix) == 0:
+        return []
+    present = ~np.isnan(emotion_matrix).all(axis=1)
+    filled = np.where(np.isnan(emotion_matrix), -np.inf, emotion_matrix)
+    dominant = filled.argmax(axis=1)
+    intensity = filled[np.arange(len(filled)), dominant]
+
+    order = np.lexsort((np.asarray(frames), np.asarray(timestamps)))
+    order = order[present[order]]
+
+    names = np.asarray(emotions, dtype=object)
+    valence = np.asarray(valence, dtype=float)[order]
+    arousal = np.asarray(arousal, dtype=float)[order]
+    return [
+        {
+            'frame': frame,
+            'emotion': emotion,
+            'intensity': value,
+            'valence': None if val != val else val,
+            'arousal': None if aro != aro else aro,
+            'timestamp_actual': timestamp,
+        }
+        for frame, emotion, value, val, aro, timestamp in zip(
+            np.asarray(frames)[order].tolist(),
+            names[dominant[order]].tolist(),
+            intensity[order].tolist(),
+            valence.tolist(),
+            arousal.tolist(),
+            np.asarray(timestamps, dtype=float)[order].tolist(),
+        )
+    ]
+
+
+def wide_frame_matrix(df, emotions=EMOTIONS):
+    """
+    Pivot a long-format session log DataFrame (columns Frame, Feature,
+    Attribute, Value, Timestamp) into (frames, timestamps, emotion_matrix,
+    valence, arousal). Duplicate rows keep the last value.
+    """
+    values = df[df['Attribute'] == 'Value']
+    wide = values.pivot_table(index='Frame', columns='Feature', values='Value', aggfunc='last')
+    wide = wide.reindex(columns=list(emotions) + ['Valence', 'Arousal'])
+    timestamps = values.groupby('Frame')['Timestamp'].last().reindex(wide.index)
+    matrix = wide.to_numpy(dtype=float)
+    return (wide.index.to_numpy(), timestamps.to_numpy(dtype=float),
+            matrix[:, :len(emotions)], matrix[:, -2], matrix[:, -1])
+
+
+def wide_value_matrix(labels, values, emotions=EMOTIONS):
+    """
+    (emotion_matrix, valence, arousal) from a (frames, len(labels)) array
+    with one column per label, as stored in .frsb logs. Labels that are not
+    in `labels` give NaN columns.
+    """
+    columns = {label: i for i, label in enumerate(labels)}
+    wanted = list(emotions) + ['Valence', 'Arousal']
+    wide = np.full((len(values), len(wanted)), np.nan)
+    for i, label in enumerate(wanted):
+        if label in columns:
+            wide[:, i] = values[:, columns[label]]
+    return wide[:, :len(emotions)], wide[:, -2], wide[:, -1]
+
+
+class EmotionWindowAggregator:
+    """
+    Incremental per-frame aggregation for push_to_server.
+
+    Each parsed Classification is written on arrival into one row of a
+    preallocated ring of NumPy arrays: a (max_frames, 7) emotion matrix plus
+    valence, arousal, frame and timestamp columns. A push drains the rows
+    received so far and reduces them with dominant_emotion_records, so it
+    costs O(frames in window) whatever the length of the session; the CSV
+    is only an audit log.
+
+    Every drained record carries the `session_id` and a per-session `seq`
+    number that increases by one per shipped frame. The highest frame
+    number shipped so far is kept as a watermark and frames at or below it
+    are ignored, so each frame is shipped exactly once and the server can
+    deduplicate idempotently on (session_id, frame).
+
+    Memory is fixed by `max_frames`: when the ring is full the oldest frame
+    is overwritten (counted in `frames_overflowed`). With `upload_fps` the
+    window keeps at most that many frames per second of arrival time and
+    counts the others in `frames_decimated`; the session log is written
+    before the window, so it still gets every frame.
+    """
+
+    def __init__(self, emotions=EMOTIONS, max_frames=3600, session_id=None, upload_fps=None):
+        self.emotions = list(emotions)
+        self._columns = {label: i for i, label in enumerate(self.emotions)}
+        self._valence_column = len(self.emotions)
+        self._arousal_column = len(self.emotions) + 1
+        self._columns['Valence'] = self._valence_column
+        self._columns['Arousal'] = self._arousal_column
+        self.max_frames = max_frames
+        self._values = np.full((max_frames, len(self.emotions) + 2), np.nan)
+        self._frames = np.zeros(max_frames, dtype=np.int64)
+        self._timestamps = np.zeros(max_frames, dtype=float)
+        self._head = 0
+        self._count = 0
+        self.frames_overflowed = 0
+        self.session_id = session_id
+        self.next_seq = 0
+        self.high_water_mark = None
+        self.frames_duplicated = 0
+        self.upload_fps = upload_fps
+        self._decimate_period = 1.0 / upload_fps if upload_fps else None
+        self._next_keep = None
+        self.frames_decimated = 0
+
+    def __len__(self):
+        return self._count
+
+    def oldest_timestamp(self):
+        """Timestamp of the oldest frame not yet drained, or None."""
+        return float(self._timestamps[self._head]) if self._count else None
+
+    def add(self, record, timestamp_actual):
+        """Write one ClassificationRecord into the ring for the next push."""
+        frame = record.frame_number if record.frame_number is not None else -1
+        if self.high_water_mark is not None and 0 <= frame <= self.high_water_mark:
+            # Already shipped
+            self.frames_duplicated += 1
+            return
+        last = (self._head + self._count - 1) % self.max_frames
+        if self._count and self._frames[last] == frame:
+            # Same frame reported twice: keep the max emotion and the latest valence/arousal
+            row = self._values[last]
+            merge = True
+        else:
+            if self._decimate_period is not None:
+                if self._next_keep is not None and timestamp_actual < self._next_keep:
+                    self.frames_decimated += 1
+                    return
+                # Keep the cadence of the kept frames, restart it after a gap
+                next_keep = (self._next_keep or timestamp_actual) + self._decimate_period
+                self._next_keep = next_keep if next_keep > timestamp_actual else timestamp_actual + self._decimate_period
+            if self._count == self.max_frames:
+                self._head = (self._head + 1) % self.max_frames
+                self._count -= 1
+                self.frames_overflowed += 1
+            last = (self._head + self._count) % self.max_frames
+            row = self._values[last]
+            row.fill(np.nan)
+            self._count += 1
+            merge = False
+        columns = self._columns
+        for label, typ, value in record.values:
+            if typ != "Value" or value is None:
+                continue
+            column = columns.get(label)
+            if column is None:
+                continue
+            if merge and column < self._valence_column:
+                row[column] = np.fmax(row[column], value)
+            else:
+                row[column] = value
+        self._frames[last] = frame
+        self._timestamps[last] = timestamp_actual
+
+    def drain(self, timestamp_end=None):
+        """Pop the frames received up to `timestamp_end` as /submit_emotion records."""
+        if not self._count:
+            return []
+        index = (self._head + np.arange(self._count)) % self.max_frames
+        if timestamp_end is not None:
+            # Frames arrive in time order: take the prefix up to timestamp_end
+            taken = int(np.searchsorted(self._timestamps[index], timestamp_end, side='right'))
+            index = index[:taken]
+        if not len(index):
+            return []
+        self._head = (self._head + len(index)) % self.max_frames
+        self._count -= len(index)
+        values = self._values[index]
+        frames = self._frames[index]
+        records = dominant_emotion_records(
+            frames,
+            self._timestamps[index],
+            values[:, :self._valence_column],
+            values[:, self._valence_column],
+            values[:, self._arousal_column],
+            self.emotions,
+        )
+        if len(frames) and frames.max() >= 0:
+            shipped = int(frames.max())
+            if self.high_water_mark is None or shipped > self.high_water_mark:
+                self.high_water_mark = shipped
+        seq = self.next_seq
+        for record in records:
+            if record['frame'] < 0:
+                record['frame'] = None
+            record['session_id'] = self.session_id
+            record['seq'] = seq
+            seq += 1
+        self.next_seq = seq
+        return records
+
+
+class EmotionTraceBuffer:
+    """
+    Fixed-size ring of the last `capacity` frames (timestamp plus one column
+    per label) for live plots. The receive path writes one row per frame;
+    readers take a decimated copy, so drawing never holds on to more than
+    `capacity` frames whatever the session length. `version` changes on
+    every write, so a reader can skip redraws when nothing arrived.
+    """
+
+    def __init__(self, labels=TRACE_LABELS, capacity=3600):
+        self.labels = list(labels)
+        self._columns = {label: i for i, label in enumerate(self.labels)}
+        self.capacity = capacity
+        self._values = np.full((capacity, len(self.labels)), np.nan)
+        self._timestamps = np.zeros(capacity, dtype=float)
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, record, timestamp_actual):
+        row = [np.nan] * len(self.labels)
+        columns = self._columns
+        for label, typ, value in record.values:
+            if typ == "Value" and value is not None:
+                column = columns.get(label)
+                if column is not None:
+                    row[column] = value
+        with self._lock:
+            self._values[self._next] = row
+            self._timestamps[self._next] = timestamp_actual
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            self.version += 1
+
+    def snapshot(self):
+        """Copies of (timestamps, values) of the buffered frames, oldest first."""
+        with self._lock:
+            index = (self._next - self._count + np.arange(self._count)) % self.capacity
+            return self._timestamps[index], self._values[index]
+
+    def decimated(self, max_points):
+        """
+        Snapshot reduced to at most 2 * max_points rows: the frames are split
+        into `max_points` buckets (one per pixel column) and each bucket
+        gives its min and max row, so peaks survive the decimation.
+        """
+        timestamps, values = self.snapshot()
+        n = len(timestamps)
+        if max_points <= 0 or n <= 2 * max_points:
+            return timestamps, values
+        starts = np.linspace(0, n, max_points + 1).astype(int)
+        ends = starts[1:] - 1
+        starts = starts[:-1]
+        lows = np.fmin.reduceat(values, starts, axis=0)
+        highs = np.fmax.reduceat(values, starts, axis=0)
+        return (np.column_stack([timestamps[starts], timestamps[ends]]).ravel(),
+                np.stack([lows, highs], axis=1).reshape(-1, values.shape[1]))
@@ -0,0 +1,340 @@
+import html
+import itertools
+import re
+import struct
+import threading
+import xml.etree.ElementTree as ET
+from typing import NamedTuple, Optional
+
+ACTION_MESSAGE_TYPE = "FaceReaderAPI.Messages.ActionMessage"
+RESPONSE_MESSAGE_TYPE = "FaceReaderAPI.Messages.ResponseMessage"
+
+_HEADER = struct.Struct('<I')
+
+
+def build_packet(message_type: str, xml_string: str) -> bytes:
+    """Construct the message bytes according to FaceReader format."""
+    type_bytes = message_type.encode('utf-8')
+    xml_bytes = xml_string.encode('utf-8')
+    type_length = len(type_bytes)
+    message_bytes = _HEADER.pack(type_length) + type_bytes + xml_bytes
+    packet_length = len(message_bytes) + 4
+    return _HEADER.pack(packet_length) + message_bytes
+
+
+def build_action_xml(action_type: str, msg_id: str = "ID001", information: list[str] = None) -> str:
+    """XML body of an ActionMessage."""
+    xml = f"""<?xml version="1.0" encoding="utf-8"?>
+                    <ActionMessage xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+                                xmlns:xsd="http://www.w3.org/2001/XMLSchema">
+                    <Id>{msg_id}</Id>
+                    <ActionType>{action_type}</ActionType>"""
+    if information:
+        xml += "\n  <Information>\n"
+        for item in information:
+            xml += f"    <string>{item}</string>\n"
+        xml += "  </Information>\n"
+    xml += "</ActionMessage>"
+    return xml
+
+
+_ACTION_PACKET_CACHE = {}
+
+
+def build_action_packet(action_type: str, msg_id: str = "ID001", information: list[str] = None) -> bytes:
+    """
+    Encoded ActionMessage packet. Messages without `information` (Start/Stop
+    analyzing, DetailedLogSending...) only differ by their Id: their bytes
+    around the Id are built once per action type.
+    """
+    if information:
+        return build_packet(ACTION_MESSAGE_TYPE, build_action_xml(action_type, msg_id, information))
+    template = _ACTION_PACKET_CACHE.get(action_type)
+    if template is None:
+        head, tail = build_action_xml(action_type, "\0").encode('utf-8').split(b"\0")
+        template = _ACTION_PACKET_CACHE[action_type] = (ACTION_MESSAGE_TYPE.encode('utf-8'), head, tail)
+    type_bytes, head, tail = template
+    id_bytes = msg_id.encode('utf-8')
+    return (_HEADER.pack(8 + len(type_bytes) + len(head) + len(id_bytes) + len(tail))
+            + _HEADER.pack(len(type_bytes)) + type_bytes + head + id_bytes + tail)
+
+
+class ResponseRouter:
+    """
+    Correlates ResponseMessages with the ActionMessages that caused them.
+
+    Every request gets a unique <Id> and a future (concurrent.futures or
+    asyncio); the single reader of the connection passes every
+    ResponseMessage to `dispatch`, which resolves the future whose Id it
+    echoes with the parsed root element. A reply without a known Id goes to
+    the oldest pending request of the same ActionType. Several actions can
+    be in flight at once, interleaved with the classification stream.
+    """
+
+    def __init__(self, prefix="ID"):
+        self.prefix = prefix
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.unmatched = 0
+
+    def next_id(self):
+        return f"{self.prefix}{next(self._ids):03d}"
+
+    @staticmethod
+    def is_response(type_name):
+        return type_name.endswith("ResponseMessage")
+
+    def register(self, action_type, future, msg_id=None):
+        """Wait for the reply to `msg_id` (a new Id if None) on `future`; returns the Id."""
+        msg_id = msg_id or self.next_id()
+        with self._lock:
+            self._pending[msg_id] = (action_type, future)
+        return msg_id
+
+    def discard(self, msg_id):
+        with self._lock:
+            self._pending.pop(msg_id, None)
+
+    def pending_count(self):
+        return len(self._pending)
+
+    def dispatch(self, xml_data):
+        """Resolve the request answered by a ResponseMessage; returns its root element, or None if malformed."""
+        try:
+            root = ET.fromstring(xml_data)
+        except ET.ParseError as e:
+            print("Failed to parse response XML:", e)
+            return None
+        msg_id = (root.findtext("Id") or "").strip()
+        action_type = (root.findtext("ActionType") or "").strip()
+        with self._lock:
+            entry = self._pending.pop(msg_id, None)
+            if entry is None and action_type:
+                for pending_id, (pending_action, _) in self._pending.items():
+                    if pending_action == action_type:
+                        entry = self._pending.pop(pending_id)
+                        break
+        if entry is None:
+            self.unmatched += 1
+        elif not entry[1].done():
+            entry[1].set_result(root)
+        return root
+
+    def fail_all(self, exc):
+        """Fail every pending request, e.g. when the connection closes."""
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(exc)
+
+
+class FrameDecoder:
+    """
+    Buffered decoder for the length-prefixed FaceReader framing:
+
+        <uint32 total length> <uint32 type length> <type name> <xml>
+
+    Bytes are read with `recv_into` into a preallocated bytearray and frames
+    are returned as memoryviews over that buffer, without copying. A returned
+    view is only valid until the next call to `read_frame`.
+
+    Partial headers and several frames coalesced in one read are handled;
+    data already buffered survives a socket timeout, so a poll timeout never
+    breaks the framing.
+    """
+
+    def __init__(self, sock=None, buffer_size=65536):
+        self.sock = sock
+        self._buf = bytearray(buffer_size)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+
+    def buffered(self):
+        """Number of bytes received but not yet returned as a frame."""
+        return self._end - self._start
+
+    def feed(self, data):
+        """Append bytes to the buffer (for use without a socket)."""
+        size = len(data)
+        self._reserve(size)
+        self._view[self._end:self._end + size] = data
+        self._end += size
+
+    def _reserve(self, size):
+        """Make room for at least `size` bytes after the buffered data."""
+        if len(self._buf) - self._end >= size:
+            return
+        pending = self._end - self._start
+        if pending + size <= len(self._buf):
+            # Compact: move the unread tail to the front of the buffer
+            self._view[:pending] = self._view[self._start:self._end]
+        else:
+            # Grow: a new buffer, so views handed out earlier stay intact
+            new_buf = bytearray(max(len(self._buf) * 2, pending + size))
+            new_buf[:pending] = self._view[self._start:self._end]
+            self._buf = new_buf
+            self._view = memoryview(new_buf)
+        self._start = 0
+        self._end = pending
+
+    def _fill(self):
+        """Receive more bytes from the socket. Returns False on connection close."""
+        self._reserve(4096)
+        received = self.sock.recv_into(self._view[self._end:])
+        if received == 0:
+            return False
+        self._end += received
+        return True
+
+    def next_buffered_frame(self):
+        """Pop one complete frame from the buffer as (type_name, xml view), or None."""
+        pending = self._end - self._start
+        if pending < 4:
+            return None
+        total_len = _HEADER.unpack_from(self._buf, self._start)[0]
+        if total_len < 8:
+            # Invalid frame, skip the header so the stream can move on
+            self._start += min(max(total_len, 4), pending)
+            return ("", self._view[0:0])
+        if pending < total_len:
+            self._reserve(total_len - pending)
+            return None
+        frame_start = self._start
+        type_len = _HEADER.unpack_from(self._buf, frame_start + 4)[0]
+        xml_start = min(frame_start + 8 + type_len, frame_start + total_len)
+        type_name = bytes(self._view[frame_start + 8:xml_start]).decode('utf-8', errors='replace')
+        self._start = frame_start + total_len
+        return type_name, self._view[xml_start:self._start]
+
+    def read_frame(self):
+        """
+        Block until one full frame is available and return (type_name, xml view).
+        Returns None when the connection is closed. socket.timeout propagates.
+        """
+        while True:
+            frame = self.next_buffered_frame()
+            if frame is not None:
+                return frame
+            if not self._fill():
+                return None
+
+    def frames(self):
+        """Iterate over frames until the connection closes."""
+        while True:
+            frame = self.read_frame()
+            if frame is None:
+                return
+            yield frame
+
+
+class ClassificationRecord(NamedTuple):
+    """One parsed Classification frame. `values` holds (label, type, value)
+    tuples: value is a float for Type "Value" and a string for Type "State"."""
+    frame_number: Optional[int]
+    frame_ticks: Optional[int]
+    values: list
+
+    def numeric_values(self):
+        """Label -> float for the "Value" entries of the frame."""
+        return {label: value for label, typ, value in self.values if typ == "Value" and value is not None}
+
+
+def _to_int(text):
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def _text(raw):
+    text = raw.decode('utf-8')
+    return html.unescape(text) if '&' in text else text
+
+
+_ROOT_TAG = re.compile(rb'\s*(?:<\?xml[^>]*\?>\s*)?<([A-Za-z_][\w.:-]*)')
+_FRAME_NUMBER = re.compile(rb'<FrameNumber>\s*([^<]*?)\s*</FrameNumber>')
+_FRAME_TICKS = re.compile(rb'<FrameTimeTicks>\s*([^<]*?)\s*</FrameTimeTicks>')
+_CLASSIFICATION_VALUE = re.compile(
+    rb'<ClassificationValue>\s*<Label>([^<]*)</Label>\s*<Type>(Value|State)</Type>\s*'
+    rb'(?:<Value>\s*<float>([^<]*)</float>\s*</Value>|<Value\s*/>)?\s*'
+    rb'(?:<State>\s*<string>([^<]*)</string>\s*</State>|<State\s*/>)?'
+)
+
+
+def _parse_classification_tree(data):
+    """Fallback for layouts the targeted scan does not recognise: one ElementTree pass."""
+    try:
+        root = ET.fromstring(data)
+    except ET.ParseError as e:
+        raise ValueError(f"Malformed Classification XML: {e}") from e
+    if root.tag != "Classification":
+        return None
+    frame_number = frame_ticks = None
+    values = []
+    for child in root:
+        if child.tag == "FrameNumber":
+            frame_number = _to_int(child.text)
+        elif child.tag == "FrameTimeTicks":
+            frame_ticks = _to_int(child.text)
+    for val in root.iter("ClassificationValue"):
+        fields = {}
+        for child in val:
+            if child.tag in ("Value", "State"):
+                inner = next(iter(child), None)
+                fields[child.tag] = inner.text if inner is not None else None
+            else:
+                fields[child.tag] = child.text
+        typ = fields.get("Type")
+        label = fields.get("Label") or "?"
+        if typ == "Value":
+            values.append((label, typ, _to_float(fields.get("Value"))))
+        elif typ == "State":
+            values.append((label, typ, fields.get("State") or ""))
+    return ClassificationRecord(frame_number, frame_ticks, values)
+
+
+def parse_classification(xml_data):
+    """
+    Targeted parser for Classification messages: extracts FrameNumber,
+    FrameTimeTicks and the Label/Type/Value/State tuples in one scan of the
+    raw bytes, without building an element tree.
+
+    Messages whose layout differs from the FaceReader serializer output fall
+    back to a single ElementTree pass. Returns a ClassificationRecord, or
+    None if the message is not a Classification. Raises ValueError on
+    malformed XML.
+    """
+    data = xml_data.encode('utf-8') if isinstance(xml_data, str) else bytes(xml_data)
+    root = _ROOT_TAG.match(data)
+    if root is not None and root.group(1) != b"Classification":
+        return None
+
+    matches = _CLASSIFICATION_VALUE.findall(data)
+    if (root is None or len(matches) != data.count(b"<ClassificationValue>")
+            or not data.rstrip().endswith(b"</Classification>")):
+        return _parse_classification_tree(data)
+
+    frame_number = _FRAME_NUMBER.search(data)
+    frame_ticks = _FRAME_TICKS.search(data)
+    values = []
+    for label, typ, value, state in matches:
+        if typ == b"Value":
+            values.append((_text(label), "Value", _to_float(value) if value else None))
+        else:
+            values.append((_text(label), "State", _text(state)))
+    return ClassificationRecord(
+        _to_int(frame_number.group(1)) if frame_number else None,
+        _to_int(frame_ticks.group(1)) if frame_ticks else None,
+        values,
+    )
@@ -0,0 +1,235 @@
+"""
+Local FaceReader protocol simulator for load and latency testing.
+
+Speaks the same length-prefixed ActionMessage / Classification framing as
+FaceReaderConnector, answers the Start/Stop analyzing and DetailedLogSending
+actions and streams synthetic classifications at a configurable rate.
+
+    python facereader_simulator.py --port 9090 --fps 30 --labels 29
+"""
+import argparse
+import asyncio
+import random
+import xml.etree.ElementTree as ET
+
+from emotion_window import VALUE_LABELS
+from facereader_protocol import RESPONSE_MESSAGE_TYPE, FrameDecoder, build_packet
+
+CLASSIFICATION_TYPE = "FaceReaderAPI.Data.Classification"
+RESPONSE_TYPE = RESPONSE_MESSAGE_TYPE
+
+STATES = {
+    'Gender': ['Male', 'Female'],
+    'Age': ['20 - 30', '30 - 40'],
+    'Left Eye': ['Open', 'Closed'],
+    'Right Eye': ['Open', 'Closed'],
+    'Mouth': ['Closed', 'Open'],
+}
+
+
+def classification_xml(frame, labels=None, rng=random):
+    """Synthetic Classification message. `labels` are the Value labels (default: all 29)."""
+    labels = labels or VALUE_LABELS
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<Classification xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xmlns:xsd="http://www.w3.org/2001/XMLSchema">'
+        '<LogType>DetailedLog</LogType>'
+        f'<FrameNumber>{frame}</FrameNumber>'
+        f'<FrameTimeTicks>{frame * 333333}</FrameTimeTicks>'
+        '<ClassificationValues>'
+    ]
+    for label in labels:
+        low = -1.0 if label == 'Valence' else 0.0
+        parts.append(
+            f'<ClassificationValue><Label>{label}</Label><Type>Value</Type>'
+            f'<Value><float>{rng.uniform(low, 1.0):.6f}</float></Value><State /></ClassificationValue>'
+        )
+    for label, options in STATES.items():
+        parts.append(
+            f'<ClassificationValue><Label>{label}</Label><Type>State</Type>'
+            f'<Value /><State><string>{rng.choice(options)}</string></State></ClassificationValue>'
+        )
+    parts.append('</ClassificationValues></Classification>')
+    return "".join(parts)
+
+
+def response_xml(msg_id, action_type, success=True):
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<ResponseMessage xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xmlns:xsd="http://www.w3.org/2001/XMLSchema">'
+        f'<Id>{msg_id}</Id><ActionType>{action_type}</ActionType>'
+        f'<ResponseType>{"Success" if success else "Failure"}</ResponseType>'
+        '</ResponseMessage>'
+    )
+
+
+class FaceReaderSimulator:
+    """
+    asyncio TCP server emulating FaceReader's external API.
+
+    `fps` and `labels` set the classification stream of every client, and
+    at most `max_clients` clients are served at once. For robustness tests
+    packets can be split into random fragments (`fragment`), several frames
+    can be coalesced into one write (`coalesce` frames per write) and a
+    fraction `malformed_rate` of classifications is sent with broken XML.
+    """
+
+    def __init__(self, host='127.0.0.1', port=9090, fps=30, labels=len(VALUE_LABELS), max_clients=16,
+                 fragment=False, coalesce=1, malformed_rate=0.0, seed=None):
+        self.host = host
+        self.port = port
+        self.fps = fps
+        self.labels = VALUE_LABELS[:labels]
+        self.max_clients = max_clients
+        self.fragment = fragment
+        self.coalesce = max(1, coalesce)
+        self.malformed_rate = malformed_rate
+        self.rng = random.Random(seed)
+        self.server = None
+        self.clients = 0
+        self.frames_sent = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"FaceReader simulator listening on {self.host}:{self.port}")
+        return self
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _write(self, writer, state, packet):
+        # One writer at a time, so a response never lands inside a fragmented frame
+        async with state["write_lock"]:
+            if not self.fragment:
+                writer.write(packet)
+                await writer.drain()
+                return
+            position = 0
+            while position < len(packet):
+                size = self.rng.randint(1, max(1, len(packet) // 3))
+                writer.write(packet[position:position + size])
+                await writer.drain()
+                position += size
+                await asyncio.sleep(0)
+
+    def _classification_packet(self, frame):
+        xml = classification_xml(frame, self.labels, self.rng)
+        if self.malformed_rate and self.rng.random() < self.malformed_rate:
+            xml = xml[:self.rng.randint(1, len(xml) - 1)]
+        return build_packet(CLASSIFICATION_TYPE, xml)
+
+    async def _stream(self, writer, state):
+        loop = asyncio.get_running_loop()
+        interval = self.coalesce / self.fps
+        # The schedule outlives Stop/Start DetailedLogSending, so polling clients still get `fps`
+        next_send = max(state["next_send"], loop.time())
+        while state["streaming"]:
+            await asyncio.sleep(max(0.0, next_send - loop.time()))
+            if not state["streaming"]:
+                break
+            packets = []
+            for _ in range(self.coalesce):
+                state["frame"] += 1
+                packets.append(self._classification_packet(state["frame"]))
+            await self._write(writer, state, b"".join(packets))
+            self.frames_sent += len(packets)
+            next_send += interval
+            state["next_send"] = next_send
+
+    @staticmethod
+    async def _stop_stream(stream_task):
+        """Cancel a classification stream and wait for it, so two streams never overlap."""
+        if stream_task is None:
+            return
+        stream_task.cancel()
+        try:
+            await stream_task
+        except (asyncio.CancelledError, ConnectionError, OSError):
+            # Cancelled as asked, or the client went away mid-write
+            pass
+
+    async def _handle_client(self, reader, writer):
+        if self.clients >= self.max_clients:
+            writer.close()
+            return
+        self.clients += 1
+        decoder = FrameDecoder(buffer_size=4096)
+        state = {"analyzing": False, "streaming": False, "frame": 0, "next_send": 0.0,
+                 "write_lock": asyncio.Lock()}
+        stream_task = None
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                decoder.feed(data)
+                while True:
+                    frame = decoder.next_buffered_frame()
+                    if frame is None:
+                        break
+                    try:
+                        root = ET.fromstring(frame[1])
+                    except ET.ParseError:
+                        continue
+                    msg_id = root.findtext("Id", "")
+                    action = root.findtext("ActionType", "")
+                    if action == "FaceReader_Start_Analyzing":
+                        state["analyzing"] = True
+                    elif action == "FaceReader_Stop_Analyzing":
+                        state["analyzing"] = state["streaming"] = False
+                        await self._stop_stream(stream_task)
+                        stream_task = None
+                    elif action == "FaceReader_Start_DetailedLogSending":
+                        if state["analyzing"] and (stream_task is None or stream_task.done()):
+                            await self._stop_stream(stream_task)
+                            state["streaming"] = True
+                            stream_task = asyncio.create_task(self._stream(writer, state))
+                    elif action == "FaceReader_Stop_DetailedLogSending":
+                        state["streaming"] = False
+                        await self._stop_stream(stream_task)
+                        stream_task = None
+                    await self._write(writer, state, build_packet(RESPONSE_TYPE, response_xml(msg_id, action)))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            state["streaming"] = False
+            await self._stop_stream(stream_task)
+            self.clients -= 1
+            writer.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="FaceReader protocol simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9090)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--labels", type=int, default=len(VALUE_LABELS), help="Value labels per classification")
+    parser.add_argument("--max-clients", type=int, default=16)
+    parser.add_argument("--fragment", action="store_true", help="split packets into random fragments")
+    parser.add_argument("--coalesce", type=int, default=1, help="frames per socket write")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="fraction of truncated XML messages")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    simulator = FaceReaderSimulator(
+        host=args.host, port=args.port, fps=args.fps, labels=args.labels, max_clients=args.max_clients,
+        fragment=args.fragment, coalesce=args.coalesce, malformed_rate=args.malformed_rate, seed=args.seed,
+    )
+    try:
+        asyncio.run(simulator.serve_forever())
+    except KeyboardInterrupt:
+        print("Simulator stopped.")
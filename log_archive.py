@@ -0,0 +1,322 @@
+"""
+Rotation, compression and retention of the session logs under logs/<user>.
+
+A session log is written as one or more segments: data_<ts>.csv (or .frsb),
+then data_<ts>.part001.csv, data_<ts>.part002.csv, ... once the current
+segment reaches `rotate_bytes` or is `rotate_seconds` old. Closed segments
+are compressed to <segment>.gz (or .zst, with the optional `zstandard`
+package) on a background worker, which then deletes the oldest sessions
+beyond `max_age_days` or `max_total_bytes`. Sidecars (.stimuli.json, .idx)
+keep the name of the uncompressed segment. Readers open any segment with
+`session_log.open_log`:
+
+    python log_archive.py logs/alice --compression gzip --max-age-days 30
+"""
+import argparse
+import glob
+import gzip
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+
+from session_binary import BinarySessionWriter
+from session_log import COMPRESSED_SUFFIXES, SessionLogWriter, log_base, zstandard
+
+_SUFFIXES = {method: suffix for suffix, method in COMPRESSED_SUFFIXES.items()}
+# data_<ts>[.partNNN].csv|frsb[.gz|.zst]; reprocessing outputs (.emotions.csv) do not match
+_SEGMENT_NAME = re.compile(r"^data_\d+(?:\.\d+)?(?:\.part\d+)?\.(?:csv|frsb)(?:\.gz|\.zst)?$")
+_PART = re.compile(r"\.part(\d+)(?=\.(?:csv|frsb)$)")
+_CHUNK = 1 << 20
+
+
+def is_session_log(path):
+    return bool(_SEGMENT_NAME.match(os.path.basename(path)))
+
+
+def session_segment(path):
+    """(path of the session's first segment, segment number) of any segment, compressed or not."""
+    base = log_base(path)
+    match = _PART.search(base)
+    if match is None:
+        return base, 0
+    return base[:match.start()] + base[match.end():], int(match.group(1))
+
+
+def compress_log(path, method="gzip"):
+    """Compress a closed segment next to itself, remove the original and return the new path."""
+    if method not in _SUFFIXES:
+        raise ValueError(f"Unknown log compression: {method}")
+    out_path = path + _SUFFIXES[method]
+    tmp_path = out_path + ".tmp"
+    with open(path, 'rb') as source:
+        if method == "gzip":
+            with gzip.open(tmp_path, 'wb', compresslevel=6) as target:
+                shutil.copyfileobj(source, target, _CHUNK)
+        else:
+            if zstandard is None:
+                raise ValueError("zstd log compression needs the zstandard package")
+            with open(tmp_path, 'wb') as target:
+                zstandard.ZstdCompressor(level=3).copy_stream(source, target, read_size=_CHUNK)
+    os.replace(tmp_path, out_path)
+    os.remove(path)
+    return out_path
+
+
+def _session_groups(log_dir):
+    """{segment base path: [files]} for every segment under `log_dir`, with its sidecars."""
+    groups = {}
+    for path in glob.glob(os.path.join(glob.escape(log_dir), "**", "data_*"), recursive=True):
+        if is_session_log(path):
+            groups.setdefault(log_base(path), [])
+    for base in groups:
+        groups[base] = [path for path in glob.glob(glob.escape(base) + "*") if os.path.isfile(path)]
+    return groups
+
+
+def enforce_retention(log_dir, max_age_days=None, max_total_bytes=None, exclude=()):
+    """
+    Delete the oldest segments (with their sidecars) older than `max_age_days`
+    or beyond `max_total_bytes` in total. Segments in `exclude` (being written)
+    are kept. Returns (files deleted, bytes deleted).
+    """
+    if max_age_days is None and max_total_bytes is None:
+        return 0, 0
+    exclude = {log_base(path) for path in exclude}
+    segments = []
+    total = 0
+    for base, files in _session_groups(log_dir).items():
+        try:
+            size = sum(os.path.getsize(path) for path in files)
+            mtime = max(os.path.getmtime(path) for path in files)
+        except (OSError, ValueError):
+            continue
+        total += size
+        if base not in exclude:
+            segments.append((mtime, base, files, size))
+    segments.sort()
+    cutoff = time.time() - max_age_days * 86400 if max_age_days is not None else None
+    files_deleted = bytes_deleted = 0
+    for mtime, base, files, size in segments:
+        too_old = cutoff is not None and mtime < cutoff
+        too_big = max_total_bytes is not None and total > max_total_bytes
+        if not (too_old or too_big):
+            continue
+        for path in files:
+            try:
+                os.remove(path)
+                files_deleted += 1
+            except OSError as e:
+                print(f"[WARN] Could not delete {path}: {e!r}")
+        total -= size
+        bytes_deleted += size
+    return files_deleted, bytes_deleted
+
+
+class SessionLogArchive:
+    """
+    Rotation, compression and retention policy of the session logs under
+    `log_dir`, with the worker thread that compresses closed segments and
+    applies the retention after each of them. Without arguments nothing is
+    rotated, compressed or deleted.
+    """
+
+    def __init__(self, log_dir='logs', rotate_bytes=None, rotate_seconds=None, compression=None,
+                 max_age_days=None, max_total_bytes=None):
+        if compression not in (None,) + tuple(_SUFFIXES):
+            raise ValueError(f"Unknown log compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd log compression needs the zstandard package")
+        self.log_dir = log_dir
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compression = compression
+        self.max_age_days = max_age_days
+        self.max_total_bytes = max_total_bytes
+        # Segments being written, never compressed or deleted
+        self.active = set()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.segments_rotated = 0
+        self.segments_compressed = 0
+        self.bytes_before_compression = 0
+        self.bytes_after_compression = 0
+        self.files_deleted = 0
+        self.bytes_deleted = 0
+
+    @classmethod
+    def from_config(cls, log_dir, config_data):
+        """Policy from the LOG_* keys of config.json (sizes in MB, rotation time in minutes)."""
+        rotate_mb = config_data.get("LOG_ROTATE_MB")
+        rotate_minutes = config_data.get("LOG_ROTATE_MINUTES")
+        retention_mb = config_data.get("LOG_RETENTION_MB")
+        return cls(
+            log_dir,
+            rotate_bytes=int(rotate_mb * 1e6) if rotate_mb else None,
+            rotate_seconds=rotate_minutes * 60 if rotate_minutes else None,
+            compression=config_data.get("LOG_COMPRESSION"),
+            max_age_days=config_data.get("LOG_RETENTION_DAYS"),
+            max_total_bytes=int(retention_mb * 1e6) if retention_mb else None,
+        )
+
+    def rotate_due(self, size, opened_at):
+        """True when a segment of `size` bytes opened at monotonic `opened_at` should be rotated."""
+        if self.rotate_bytes is not None and size >= self.rotate_bytes:
+            return True
+        return self.rotate_seconds is not None and time.monotonic() - opened_at >= self.rotate_seconds
+
+    @staticmethod
+    def segment_path(base_path, number):
+        """Path of segment `number` of the session log `base_path` (0 is `base_path` itself)."""
+        if not number:
+            return base_path
+        root, extension = os.path.splitext(base_path)
+        return f"{root}.part{number:03d}{extension}"
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="SessionLogArchive", daemon=True)
+            self._thread.start()
+
+    def closed(self, path):
+        """Hand over a segment that will not be written again."""
+        self.active.discard(path)
+        if self.compression is not None or self.max_age_days is not None or self.max_total_bytes is not None:
+            self.start()
+            self._queue.put(path)
+
+    def sweep(self):
+        """Apply the retention now, on the worker."""
+        if self.max_age_days is not None or self.max_total_bytes is not None:
+            self.start()
+            self._queue.put(None)
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            try:
+                if path is not None and self.compression is not None and os.path.exists(path):
+                    before = os.path.getsize(path)
+                    after = os.path.getsize(compress_log(path, self.compression))
+                    with self._lock:
+                        self.segments_compressed += 1
+                        self.bytes_before_compression += before
+                        self.bytes_after_compression += after
+                files, size = enforce_retention(self.log_dir, self.max_age_days, self.max_total_bytes,
+                                                exclude=set(self.active))
+                with self._lock:
+                    self.files_deleted += files
+                    self.bytes_deleted += size
+            except Exception as e:
+                print(f"[WARN] Session log archive: {e!r}")
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """Wait until every handed over segment is compressed and the retention applied."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self._queue.qsize(),
+                "segments_rotated": self.segments_rotated,
+                "segments_compressed": self.segments_compressed,
+                "compression_ratio": (self.bytes_before_compression / self.bytes_after_compression
+                                      if self.bytes_after_compression else None),
+                "files_deleted": self.files_deleted,
+                "bytes_deleted": self.bytes_deleted,
+            }
+
+
+class RotatingSessionLog:
+    """
+    Session log writer split into segments by `archive`: a drop-in
+    replacement of SessionLogWriter / BinarySessionWriter (chosen by the
+    extension of `csv_path`). `csv_path` stays the path of the first segment
+    and `path` is the segment being written; `write_record` rotates when due,
+    unless the caller rotates first with `rotate()`.
+    """
+
+    def __init__(self, csv_path, archive=None):
+        self.csv_path = csv_path
+        self.archive = archive or SessionLogArchive(os.path.dirname(csv_path))
+        self.segments = []
+        self._writer = None
+        self._open(csv_path)
+
+    def _open(self, path):
+        self.path = path
+        self.segments.append(path)
+        self.archive.active.add(path)
+        self._writer = BinarySessionWriter(path) if path.endswith(".frsb") else SessionLogWriter(path)
+        self._opened_at = time.monotonic()
+
+    @property
+    def closed(self):
+        return self._writer.closed
+
+    @property
+    def size(self):
+        return self._writer.size
+
+    def rotate_due(self):
+        return not self.closed and self._writer.size > 0 and self.archive.rotate_due(self._writer.size,
+                                                                                     self._opened_at)
+
+    def rotate(self):
+        """Close the current segment, hand it to the archive and open the next one; returns its path."""
+        self.close()
+        with self.archive._lock:
+            self.archive.segments_rotated += 1
+        self._open(self.archive.segment_path(self.csv_path, len(self.segments)))
+        return self.path
+
+    def write_record(self, record, timestamp_actual):
+        if self.rotate_due():
+            self.rotate()
+        self._writer.write_record(record, timestamp_actual)
+
+    def flush(self):
+        self._writer.flush()
+
+    def offset(self):
+        """Position of the next frame in the current segment."""
+        return self._writer.offset()
+
+    def close(self):
+        if self._writer.closed:
+            return
+        self._writer.close()
+        self.archive.closed(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compress and expire closed session logs")
+    parser.add_argument("log_dir")
+    parser.add_argument("--compression", choices=sorted(_SUFFIXES), default=None)
+    parser.add_argument("--max-age-days", type=float, default=None)
+    parser.add_argument("--max-total-mb", type=float, default=None)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    # Run offline only: a segment being written would be compressed too
+    args = parse_args()
+    if args.compression:
+        for base in sorted(_session_groups(args.log_dir)):
+            if os.path.exists(base):
+                print(f"{base} -> {compress_log(base, args.compression)}")
+    max_total_bytes = int(args.max_total_mb * 1e6) if args.max_total_mb else None
+    files, size = enforce_retention(args.log_dir, args.max_age_days, max_total_bytes)
+    print(f"Deleted {files} files ({size / 1e6:.1f} MB)")
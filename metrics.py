@@ -0,0 +1,130 @@
+import bisect
+import http.server
+import json
+import threading
+import time
+
+# Bucket upper bounds in seconds: 10 us to ~168 s, doubling
+_BOUNDS = [1e-5 * 2 ** i for i in range(25)]
+
+
+class LatencyHistogram:
+    """
+    Fixed log-scale latency histogram. `observe` is a bisect and three
+    additions, cheap enough for the per-frame path. Each histogram is meant
+    to be written by one thread; snapshots from other threads are
+    approximate.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (0 < q <= 1)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return _BOUNDS[i] if i < len(_BOUNDS) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.max if self.count else None,
+        }
+
+
+class Metrics:
+    """Named counters and latency histograms with a JSON-friendly snapshot."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.monotonic()
+
+    def incr(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def observe(self, name, seconds):
+        self.histogram(name).observe(seconds)
+
+    def reset(self):
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.monotonic()
+
+    def snapshot(self):
+        return {
+            "uptime": time.monotonic() - self.started,
+            "counters": dict(self.counters),
+            "latency": {name: h.snapshot() for name, h in list(self.histograms.items())},
+        }
+
+    def summary(self, names=("recv", "parse", "log", "aggregate", "push", "end_to_end")):
+        """One line per stage for a live readout: count, p50 and p95 in ms."""
+        lines = []
+        for name in names:
+            histogram = self.histograms.get(name)
+            if histogram is None or not histogram.count:
+                continue
+            lines.append(f"{name:>10}: n={histogram.count} p50={histogram.percentile(0.5) * 1e3:.2f}ms "
+                         f"p95={histogram.percentile(0.95) * 1e3:.2f}ms")
+        return "\n".join(lines)
+
+
+class MetricsServer:
+    """Local HTTP endpoint serving `snapshot_func()` as JSON on GET /metrics."""
+
+    def __init__(self, snapshot_func, host='127.0.0.1', port=9100):
+        snapshot = snapshot_func
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = json.dumps(snapshot()).encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.port = self.server.server_port
+        self._thread = threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,393 @@
+import queue
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from emotion_codec import encode_batch, finite
+
+
+def pooled_session(pool_size=20):
+    """
+    Keep-alive requests session with a connection pool. It does not retry:
+    EmotionSender.post owns the retries and their backoff, and a POST that
+    timed out reading the response may already have been stored.
+    """
+    http = requests.Session()
+    http.trust_env = False  # avoids Windows proxy/AV issues in many cases
+    adapter = HTTPAdapter(max_retries=0, pool_connections=pool_size, pool_maxsize=pool_size)
+    http.mount("https://", adapter)
+    http.mount("http://", adapter)
+    return http
+
+
+def _is_ok(status):
+    return status is not None and 200 <= status < 300
+
+
+def _is_final(status):
+    """2xx, or a 4xx the server will not accept on retry."""
+    return status is not None and status < 500 and status != 429
+
+
+class PushPolicy:
+    """
+    Decides when the receive loop pushes a batch: when `max_records` frames
+    are pending, or when the oldest pending frame is older than the
+    effective interval.
+
+    The interval starts at `initial_interval` and adapts to the POST round
+    trips and errors reported by the sender: it aims at a wait of
+    `target_latency` minus the smoothed round trip, is never shorter than
+    1.5 round trips (so batches do not pile up behind a slow tunnel),
+    grows with the error rate, and stays within
+    [min_interval, max_interval].
+    """
+
+    def __init__(self, initial_interval=1.0, min_interval=0.2, max_interval=10.0,
+                 max_records=600, target_latency=1.0, smoothing=0.2, error_threshold=0.1):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_records = max_records
+        self.target_latency = target_latency
+        self.smoothing = smoothing
+        self.error_threshold = error_threshold
+        self.interval = min(max(initial_interval, min_interval), max_interval)
+        self.round_trip = None
+        self.error_rate = 0.0
+
+    def should_flush(self, pending_records, oldest_age):
+        return pending_records >= self.max_records or (pending_records > 0 and oldest_age >= self.interval)
+
+    def record(self, round_trip, ok):
+        """Feed the outcome of one POST attempt (round_trip is None when there was no response)."""
+        a = self.smoothing
+        if round_trip is not None:
+            self.round_trip = round_trip if self.round_trip is None else (1 - a) * self.round_trip + a * round_trip
+        self.error_rate = (1 - a) * self.error_rate + a * (0.0 if ok else 1.0)
+        round_trip = self.round_trip or 0.0
+        interval = max(self.target_latency - round_trip, 1.5 * round_trip)
+        if self.error_rate > self.error_threshold:
+            interval *= 1 + 4 * self.error_rate
+        self.interval = min(max(interval, self.min_interval), self.max_interval)
+
+    def stats(self):
+        return {
+            "effective_interval": self.interval,
+            "round_trip": self.round_trip,
+            "error_rate": self.error_rate,
+            "max_records": self.max_records,
+        }
+
+
+class EmotionSender:
+    """
+    Background sender for /submit_emotion batches.
+
+    The receive thread only calls `submit`: batches go into a queue bounded
+    by `max_queue` batches and `max_queued_records` records, and a worker
+    thread posts them over a pooled keep-alive session, with explicit
+    timeouts and retries with exponential backoff. When the queue is full,
+    `overflow="drop_oldest"` drops the oldest queued batch and
+    `overflow="block"` makes `submit` wait for room, for at most
+    `block_timeout` seconds, before dropping the oldest batch anyway.
+
+    With an EmotionOutbox every batch is stored on disk before it is queued.
+    Batches that failed or were dropped stay pending there; when the live
+    queue is idle the worker replays them in order, several batches per
+    POST, at no more than `replay_records_per_second`.
+
+    Batches are encoded with `wire_format` ("json" or "columnar", see
+    emotion_codec) and `compression` (None, "gzip" or "zstd"). If the
+    server answers 400 or 415 to a columnar or compressed batch, the
+    sender falls back to plain JSON for good.
+
+    Session features (see `submit_features`) are not part of the records:
+    the latest snapshot of each session is posted as JSON to `features_path`
+    after the next delivered batch or when the queue is idle, once, best
+    effort. A server without that
+    endpoint (404/405) gets no more of them.
+    """
+
+    def __init__(self, server_url, path="/submit_emotion", http=None, max_queue=256,
+                 timeout=(3.05, 10), max_attempts=4, backoff_seconds=0.5,
+                 outbox=None, replay_records_per_second=500, replay_batch_limit=50,
+                 replay_retry_seconds=5.0, metrics=None, policy=None, max_queued_records=36000,
+                 overflow="drop_oldest", block_timeout=5.0, wire_format="json", compression=None,
+                 features_path="/submit_features"):
+        if overflow not in ("drop_oldest", "block"):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.url = server_url.strip().rstrip("/") + path
+        self.features_url = server_url.strip().rstrip("/") + features_path if features_path else None
+        self.http = http or pooled_session()
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._room = threading.Condition(self._lock)
+        self.max_queued_records = max_queued_records
+        self.overflow = overflow
+        self.wire_format = wire_format
+        self.compression = compression
+        self.payload_bytes = 0
+        self.last_payload_bytes = None
+        self._encode_total = 0.0
+        self._encode_count = 0
+        self.block_timeout = block_timeout
+        self._queued_records = 0
+        self.seconds_blocked = 0.0
+        self.batches_sent = 0
+        self.batches_failed = 0
+        self.batches_dropped = 0
+        self.last_latency = None
+        self._latency_total = 0.0
+        self._latency_count = 0
+        self.outbox = outbox
+        self.metrics = metrics
+        self.policy = policy
+        self.replay_records_per_second = replay_records_per_second
+        self.replay_batch_limit = replay_batch_limit
+        self.replay_retry_seconds = replay_retry_seconds
+        self._queued_ids = set()
+        self._next_replay = 0.0
+        self.batches_replayed = 0
+        # Latest features snapshot per session, not posted yet
+        self._features = {}
+        self.features_sent = 0
+
+    def start(self):
+        # Also when a previous stop() timed out with the worker still posting: it keeps running
+        self._stop.clear()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="EmotionSender", daemon=True)
+            self._thread.start()
+
+    def _is_full(self, records):
+        return self._queue.qsize() and (self._queue.full()
+                                        or self._queued_records + records > self.max_queued_records)
+
+    def submit(self, batch):
+        """Queue a batch for sending, applying the overflow policy when the queue is full."""
+        outbox_id = None
+        if self.outbox is not None:
+            outbox_id = self.outbox.add(batch)
+        with self._room:
+            if outbox_id is not None:
+                self._queued_ids.add(outbox_id)
+            deadline = None
+            while self._is_full(len(batch)):
+                if self.overflow == "block":
+                    now = time.monotonic()
+                    deadline = deadline or now + self.block_timeout
+                    if now < deadline and self._thread is not None and self._thread.is_alive():
+                        self._room.wait(deadline - now)
+                        self.seconds_blocked += time.monotonic() - now
+                        continue
+                try:
+                    dropped_id, dropped = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._queue.task_done()
+                # Still pending in the outbox, it will be replayed
+                self._queued_ids.discard(dropped_id)
+                self._queued_records -= len(dropped)
+                self.batches_dropped += 1
+            self._queue.put_nowait((outbox_id, batch))
+            self._queued_records += len(batch)
+
+    def submit_features(self, payload):
+        """Queue `payload` ({"session_id": ..., "features": {...}}), replacing the unsent one of its session."""
+        with self._lock:
+            self._features[payload.get("session_id")] = payload
+
+    def _post_features(self):
+        """Post the pending features snapshots once each; a failed one is superseded by the next."""
+        with self._lock:
+            pending = list(self._features.values())
+            self._features.clear()
+        for payload in pending:
+            if self.features_url is None:
+                return
+            try:
+                response = self.http.post(self.features_url, json=finite(payload), timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                print(f"[WARN] Request error posting to {self.features_url}: {e}")
+                continue
+            if response.status_code in (404, 405):
+                print(f"[WARN] {self.features_url} -> {response.status_code}, not sending features")
+                self.features_url = None
+            elif response.status_code < 300:
+                with self._lock:
+                    self.features_sent += 1
+            else:
+                print(f"[WARN] {self.features_url} -> {response.status_code}: {response.text[:200]}")
+
+    def encode(self, batch):
+        """Body and headers of one batch in the current wire format, with size and encode time accounted."""
+        start = time.perf_counter()
+        body, headers = encode_batch(batch, self.wire_format, self.compression)
+        elapsed = time.perf_counter() - start
+        if self.metrics is not None:
+            self.metrics.observe("encode", elapsed)
+            self.metrics.incr("payload_bytes", len(body))
+        with self._lock:
+            self.last_payload_bytes = len(body)
+            self.payload_bytes += len(body)
+            self._encode_total += elapsed
+            self._encode_count += 1
+        return body, headers
+
+    def post(self, batch, end_to_end="end_to_end"):
+        """
+        Post one batch with retries. Returns the last HTTP status, or None if
+        no response. On success the records' latency goes to the `end_to_end` histogram.
+        """
+        status = None
+        body, headers = self.encode(batch)
+        for attempt in range(self.max_attempts):
+            if attempt:
+                time.sleep(self.backoff_seconds * (2 ** (attempt - 1)))
+            start = time.perf_counter()
+            try:
+                response = self.http.post(self.url, data=body, headers=headers, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                # SSL EOF and dropped tunnels end up here: log and retry instead of killing the thread
+                print(f"[WARN] Request error posting to {self.url}: {e}")
+                if self.policy is not None:
+                    self.policy.record(None, False)
+                continue
+            latency = time.perf_counter() - start
+            if self.metrics is not None:
+                self.metrics.observe("push", latency)
+            if self.policy is not None:
+                self.policy.record(latency, response.status_code < 300)
+            with self._lock:
+                self.last_latency = latency
+                self._latency_total += latency
+                self._latency_count += 1
+            status = response.status_code
+            if 200 <= status < 300:
+                self._observe_end_to_end(batch, end_to_end)
+                return status
+            print(f"[WARN] {self.url} -> {status}: {response.text[:200]}")
+            if status in (400, 415) and (self.wire_format != "json" or self.compression is not None):
+                print(f"[WARN] {self.url} does not accept {self.wire_format}/{self.compression}, falling back to JSON")
+                self.wire_format = "json"
+                self.compression = None
+                body, headers = self.encode(batch)
+                continue
+            if _is_final(status):
+                return status
+        return status
+
+    def _observe_end_to_end(self, batch, name="end_to_end"):
+        """
+        Connector receipt to server acknowledgement, per record. It starts at
+        timestamp_actual, the wall-clock time the frame was read from the
+        socket, not FaceReader's capture time.
+        """
+        if self.metrics is None:
+            return
+        now = time.time()
+        histogram = self.metrics.histogram(name)
+        for record in batch:
+            timestamp = record.get('timestamp_actual')
+            if timestamp is not None:
+                histogram.observe(now - timestamp)
+
+    def _run(self):
+        while True:
+            try:
+                outbox_id, batch = self._queue.get(timeout=0.2)
+            except queue.Empty:
+                self._post_features()
+                if self._stop.is_set():
+                    return
+                try:
+                    self._replay_backlog()
+                except Exception as e:
+                    print(f"[WARN] Sender failed replaying the outbox: {e!r}")
+                    with self._lock:
+                        self.batches_failed += 1
+                    self._next_replay = time.monotonic() + self.replay_retry_seconds
+                continue
+            with self._room:
+                self._queued_records -= len(batch)
+                self._room.notify_all()
+            try:
+                status = self.post(batch)
+                with self._lock:
+                    self._queued_ids.discard(outbox_id)
+                    if _is_ok(status):
+                        self.batches_sent += 1
+                    else:
+                        self.batches_failed += 1
+                if _is_final(status):
+                    if outbox_id is not None:
+                        self.outbox.mark_delivered([outbox_id], status)
+                else:
+                    # Server unreachable: leave it in the outbox and wait before replaying
+                    self._next_replay = time.monotonic() + self.replay_retry_seconds
+                if _is_ok(status):
+                    self._post_features()
+            except Exception as e:
+                # A batch that cannot be encoded or stored must not stop the worker
+                print(f"[WARN] Sender failed on a batch of {len(batch)} records: {e!r}")
+                with self._lock:
+                    self._queued_ids.discard(outbox_id)
+                    self.batches_failed += 1
+                self._next_replay = time.monotonic() + self.replay_retry_seconds
+            finally:
+                self._queue.task_done()
+
+    def _replay_backlog(self):
+        """Send the oldest undelivered outbox batches as one bulk POST, within the throughput cap."""
+        if self.outbox is None or time.monotonic() < self._next_replay:
+            return
+        with self._lock:
+            exclude = set(self._queued_ids)
+        pending = self.outbox.pending(self.replay_batch_limit, exclude)
+        if not pending:
+            self._next_replay = time.monotonic() + 1.0
+            return
+        records = [record for _, batch in pending for record in batch]
+        # Replayed batches can be hours old: keep them out of the live end-to-end latency
+        status = self.post(records, end_to_end="end_to_end_replayed")
+        if _is_final(status):
+            self.outbox.mark_delivered([i for i, _ in pending], status)
+            with self._lock:
+                self.batches_replayed += len(pending)
+            self._next_replay = time.monotonic() + len(records) / self.replay_records_per_second
+        else:
+            self._next_replay = time.monotonic() + self.replay_retry_seconds
+
+    def stop(self, timeout=10):
+        """Send what is still queued (up to `timeout` seconds) and stop the worker."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queued_records": self._queued_records,
+                "seconds_blocked": self.seconds_blocked,
+                "batches_sent": self.batches_sent,
+                "batches_failed": self.batches_failed,
+                "batches_dropped": self.batches_dropped,
+                "batches_replayed": self.batches_replayed,
+                "outbox_pending": self.outbox.pending_count() if self.outbox is not None else None,
+                "features_sent": self.features_sent,
+                "last_latency": self.last_latency,
+                "avg_latency": self._latency_total / self._latency_count if self._latency_count else None,
+                "wire_format": self.wire_format,
+                "compression": self.compression,
+                "payload_bytes": self.payload_bytes,
+                "last_payload_bytes": self.last_payload_bytes,
+                "avg_encode_seconds": self._encode_total / self._encode_count if self._encode_count else None,
+            }
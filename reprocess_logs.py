@@ -0,0 +1,166 @@
+"""
+Offline reprocessing of historical session logs.
+
+Recomputes per-frame dominant emotion, intensity, valence and arousal for
+every data_<ts>.csv (or .frsb) session under the given directories, with
+the same aggregation as push_to_server, on a process pool. The segments of
+a rotated session (data_<ts>.partNNN.csv, compressed to .gz/.zst or not)
+are read in part order as one session. CSV logs are streamed in chunks so
+large sessions are never loaded whole. For each session it
+writes <name>.emotions.csv (one row per frame) and <name>.summary.json
+(with per-stimulus aggregates when the log has a stimulus index), and can
+re-upload the records to /submit_emotion at a rate limit.
+
+    python reprocess_logs.py logs --workers 8
+    python reprocess_logs.py logs/alice --emotions Happy,Sad,Neutral --upload https://server --rate 2000
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from emotion_window import EMOTIONS, dominant_emotion_records
+from log_archive import is_session_log, session_segment
+from push_pipeline import EmotionSender
+from session_binary import iter_binary_frames
+from session_log import COMPRESSED_SUFFIXES, iter_csv_frames, log_base
+from stimulus_index import session_stimulus_aggregates
+
+RECORD_FIELDS = ['session_id', 'seq', 'frame', 'emotion', 'intensity', 'valence', 'arousal', 'timestamp_actual']
+
+
+def reprocess_session(segments, out_dir=None, emotions=EMOTIONS, chunksize=200_000):
+    """Recompute one session log from its segments, in part order; returns its summary dict."""
+    base = session_segment(segments[0])[0]
+    session_id = os.path.splitext(os.path.basename(base))[0]
+    out_dir = out_dir or os.path.dirname(base)
+    os.makedirs(out_dir, exist_ok=True)
+    records_path = os.path.join(out_dir, session_id + ".emotions.csv")
+    iterator = iter_binary_frames if base.endswith(".frsb") else iter_csv_frames
+    chunks = (chunk for path in segments for chunk in iterator(path, emotions, chunksize))
+
+    histogram = {emotion: 0 for emotion in emotions}
+    frames = 0
+    valence_sum = arousal_sum = 0.0
+    valence_n = arousal_n = 0
+    first = last = None
+    with open(records_path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(RECORD_FIELDS)
+        for frame_ids, timestamps, matrix, valence, arousal in chunks:
+            records = dominant_emotion_records(frame_ids, timestamps, matrix, valence, arousal, emotions)
+            for record in records:
+                record['session_id'] = session_id
+                record['seq'] = frames
+                frames += 1
+                histogram[record['emotion']] += 1
+                if record['valence'] is not None:
+                    valence_sum += record['valence']
+                    valence_n += 1
+                if record['arousal'] is not None:
+                    arousal_sum += record['arousal']
+                    arousal_n += 1
+                writer.writerow([record[field] for field in RECORD_FIELDS])
+            if records:
+                first = records[0]['timestamp_actual'] if first is None else first
+                last = records[-1]['timestamp_actual']
+
+    summary = {
+        "session_id": session_id,
+        "source": segments[0],
+        "segments": len(segments),
+        "records": records_path,
+        "frames": frames,
+        "timestamp_start": first,
+        "timestamp_end": last,
+        "dominant_emotions": histogram,
+        "mean_valence": valence_sum / valence_n if valence_n else None,
+        "mean_arousal": arousal_sum / arousal_n if arousal_n else None,
+    }
+    stimuli = session_stimulus_aggregates(segments, emotions, chunksize=chunksize)
+    if stimuli:
+        summary["stimuli"] = stimuli
+    with open(os.path.join(out_dir, session_id + ".summary.json"), 'w', encoding='utf-8') as file:
+        json.dump(summary, file, indent=1)
+    return summary
+
+
+def find_logs(paths, pattern):
+    """
+    Sessions whose segments match `pattern`, each a list of its segments in
+    part order, compressed or not (the plain file if both exist).
+    """
+    found = {}
+    for path in paths:
+        if os.path.isfile(path):
+            found[log_base(path)] = path
+            continue
+        for suffix in ("",) + tuple(COMPRESSED_SUFFIXES):
+            for match in glob.glob(os.path.join(path, "**", pattern + suffix), recursive=True):
+                if is_session_log(match) and (log_base(match) not in found or match == log_base(match)):
+                    found[log_base(match)] = match
+    sessions = {}
+    for segment in found.values():
+        base, number = session_segment(segment)
+        sessions.setdefault(base, []).append((number, segment))
+    return [[segment for _, segment in sorted(sessions[base])] for base in sorted(sessions)]
+
+
+def upload_records(summary, server_url, rate, batch_size=500):
+    """Re-upload one session's records to /submit_emotion at no more than `rate` records/s."""
+    sender = EmotionSender(server_url)
+    sent = 0
+    started = time.monotonic()
+    for chunk in pd.read_csv(summary["records"], chunksize=batch_size):
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        batch = chunk.to_dict(orient="records")
+        status = sender.post(batch)
+        if status is None or status >= 300:
+            print(f"[WARN] Upload of {summary['session_id']} stopped at record {sent}: status {status}")
+            return sent
+        sent += len(batch)
+        # Rate limit: sleep until `sent` records fit in the elapsed time
+        delay = sent / rate - (time.monotonic() - started)
+        if delay > 0:
+            time.sleep(delay)
+    return sent
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute emotions from historical session logs")
+    parser.add_argument("paths", nargs="+", help="log directories or files")
+    parser.add_argument("--pattern", default="data_*.csv")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunksize", type=int, default=200_000, help="CSV rows per chunk")
+    parser.add_argument("--out-dir", default=None, help="default: next to each log")
+    parser.add_argument("--emotions", default=",".join(EMOTIONS))
+    parser.add_argument("--upload", default=None, metavar="SERVER_URL", help="re-upload to /submit_emotion")
+    parser.add_argument("--rate", type=float, default=1000, help="upload rate limit, records per second")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    emotions = [e.strip() for e in args.emotions.split(",") if e.strip()]
+    sessions = find_logs(args.paths, args.pattern)
+    print(f"Reprocessing {len(sessions)} sessions with {args.workers} workers")
+    summaries = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(reprocess_session, segments, args.out_dir, emotions, args.chunksize): segments[0]
+                   for segments in sessions}
+        for future in as_completed(futures):
+            try:
+                summary = future.result()
+            except Exception as e:
+                print(f"[WARN] {futures[future]}: {e!r}")
+                continue
+            summaries.append(summary)
+            print(f"{summary['source']}: {summary['frames']} frames in {summary['segments']} segments")
+    if args.upload:
+        for summary in sorted(summaries, key=lambda s: s["source"]):
+            print(f"Uploaded {upload_records(summary, args.upload, args.rate)} records of {summary['session_id']}")
@@ -0,0 +1,280 @@
+"""
+Compact columnar binary session log (.frsb).
+
+One fixed-width record per frame: frame number, frame ticks, timestamp and
+one float32 column per Value label. The file is memory-mappable and a
+sparse index of every `stride`-th timestamp and frame number (sidecar
+.idx file) makes time and frame range reads O(log n) plus the slice.
+State labels are not stored.
+
+Convert existing logs with:
+
+    python session_binary.py logs/<user>/data_*.csv
+"""
+import csv
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+from emotion_window import EMOTIONS, VALUE_LABELS, wide_value_matrix
+from facereader_protocol import ClassificationRecord
+from session_log import COMPRESSED_SUFFIXES, log_base, open_log
+
+MAGIC = b"FRSB"
+VERSION = 1
+_PREFIX = struct.Struct('<4sII')
+
+
+def record_dtype(n_labels):
+    return np.dtype([
+        ('frame', '<i8'),
+        ('ticks', '<i8'),
+        ('timestamp', '<f8'),
+        ('values', '<f4', (n_labels,)),
+    ])
+
+
+def _header_bytes(labels):
+    meta = json.dumps({"labels": list(labels)}).encode('utf-8')
+    header_len = _PREFIX.size + len(meta)
+    header_len += -header_len % 64
+    return _PREFIX.pack(MAGIC, VERSION, header_len) + meta.ljust(header_len - _PREFIX.size, b' ')
+
+
+class BinarySessionWriter:
+    """
+    Drop-in alternative to SessionLogWriter writing the binary format.
+    The columns are `labels` (default: every Value label FaceReader sends),
+    so frames without a face do not narrow the schema; values of any other
+    label are counted in `values_dropped` with a warning. Records are
+    buffered and appended in blocks. The sparse index is written on close.
+    """
+
+    def __init__(self, path, labels=None, max_rows=256, stride=256):
+        self.csv_path = path
+        self.path = path
+        self.max_rows = max_rows
+        self.stride = stride
+        self._file = open(path, 'ab')
+        self._rows = []
+        self.records_written = 0
+        self.values_dropped = 0
+        self._unknown_labels = set()
+        self._start(labels or VALUE_LABELS)
+        self.size = self._file.tell()
+
+    @property
+    def closed(self):
+        return self._file is None
+
+    def _start(self, labels):
+        self.labels = list(labels)
+        self._columns = {label: i for i, label in enumerate(self.labels)}
+        self._dtype = record_dtype(len(self.labels))
+        if self._file.tell() == 0:
+            self._file.write(_header_bytes(self.labels))
+
+    def write_record(self, record, timestamp_actual):
+        values = np.full(len(self.labels), np.nan, dtype=np.float32)
+        columns = self._columns
+        for label, typ, value in record.values:
+            if typ != "Value" or value is None:
+                continue
+            column = columns.get(label)
+            if column is not None:
+                values[column] = value
+            else:
+                self._drop(label)
+        self._rows.append((
+            record.frame_number if record.frame_number is not None else -1,
+            record.frame_ticks if record.frame_ticks is not None else -1,
+            timestamp_actual,
+            values,
+        ))
+        if len(self._rows) >= self.max_rows:
+            self.flush()
+
+    def _drop(self, label):
+        self.values_dropped += 1
+        if label not in self._unknown_labels:
+            self._unknown_labels.add(label)
+            print(f"[WARN] {self.path}: '{label}' is not a column of the binary log, its values are not stored")
+
+    def flush(self):
+        if self._rows and self._file is not None:
+            self._file.write(np.array(self._rows, dtype=self._dtype).tobytes())
+            self.records_written += len(self._rows)
+            self._rows.clear()
+        if self._file is not None:
+            self._file.flush()
+            self.size = self._file.tell()
+
+    def offset(self):
+        """Index of the record the next frame will be written to."""
+        return self.records_written + len(self._rows)
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+        BinarySessionReader(self.path, stride=self.stride).write_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BinarySessionReader:
+    """
+    Memory-mapped reader with O(log n) time and frame range lookups. A
+    compressed segment (.frsb.gz / .frsb.zst) is decompressed into memory.
+    """
+
+    def __init__(self, path, stride=256):
+        self.path = path
+        compressed = os.path.splitext(path)[1] in COMPRESSED_SUFFIXES
+        with open_log(path) as file:
+            magic, version, header_len = _PREFIX.unpack(file.read(_PREFIX.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a binary session log")
+            meta = json.loads(file.read(header_len - _PREFIX.size))
+            data = file.read() if compressed else None
+        self.labels = meta["labels"]
+        self.dtype = record_dtype(len(self.labels))
+        size = header_len + len(data) if compressed else os.path.getsize(path)
+        count = (size - header_len) // self.dtype.itemsize
+        # A record cut short by a crash is ignored
+        if not count:
+            self.records = np.empty(0, dtype=self.dtype)
+        elif compressed:
+            self.records = np.frombuffer(data, dtype=self.dtype, count=count)
+        else:
+            self.records = np.memmap(path, dtype=self.dtype, mode='r', offset=header_len, shape=(count,))
+        self.stride = stride
+        self._index = self._load_index()
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def index_path(self):
+        return log_base(self.path) + ".idx"
+
+    def _build_index(self):
+        return {
+            "stride": self.stride,
+            "count": len(self.records),
+            "timestamp": np.array(self.records['timestamp'][::self.stride]),
+            "frame": np.array(self.records['frame'][::self.stride]),
+        }
+
+    def _load_index(self):
+        try:
+            with np.load(self.index_path) as data:
+                index = {key: data[key] for key in data.files}
+            if int(index["count"]) == len(self.records):
+                self.stride = int(index["stride"])
+                return index
+        except (OSError, KeyError, ValueError):
+            pass
+        return self._build_index()
+
+    def write_index(self):
+        # Through a file object, so that np.savez does not append .npz to the name
+        with open(self.index_path, 'wb') as file:
+            np.savez(file, **self._index)
+
+    def _search(self, key, value, side):
+        sparse = self._index[key]
+        block = int(np.searchsorted(sparse, value, side))
+        lo = max(0, (block - 1) * self.stride)
+        hi = min(len(self.records), block * self.stride + 1)
+        return lo + int(np.searchsorted(self.records[key][lo:hi], value, side))
+
+    def time_range(self, timestamp_start, timestamp_end):
+        """Records with timestamp_start <= timestamp <= timestamp_end (a view on the map)."""
+        return self.records[self._search('timestamp', timestamp_start, 'left'):
+                            self._search('timestamp', timestamp_end, 'right')]
+
+    def frame_range(self, frame_start, frame_end):
+        """Records with frame_start <= frame <= frame_end (a view on the map)."""
+        return self.records[self._search('frame', frame_start, 'left'):
+                            self._search('frame', frame_end, 'right')]
+
+    def column(self, records, label):
+        """Float values of one label for a slice of records."""
+        return records['values'][:, self.labels.index(label)]
+
+    def iter_frames(self, emotions=EMOTIONS, chunksize=200_000, start=0, end=None):
+        """
+        Wide per-frame arrays (frames, timestamps, emotion_matrix, valence,
+        arousal) of records [start, end), `chunksize` records at a time.
+        """
+        end = len(self.records) if end is None else min(end, len(self.records))
+        for chunk_start in range(start, end, chunksize):
+            records = self.records[chunk_start:min(chunk_start + chunksize, end)]
+            matrix, valence, arousal = wide_value_matrix(self.labels, records['values'], emotions)
+            yield records['frame'].astype(np.int64), records['timestamp'].astype(float), matrix, valence, arousal
+
+
+def iter_binary_frames(path, emotions=EMOTIONS, chunksize=200_000):
+    """Wide per-frame arrays of a .frsb log (compressed or not), in chunks."""
+    return BinarySessionReader(path).iter_frames(emotions, chunksize)
+
+
+def _value_labels(csv_path):
+    labels = {}
+    with open_log(csv_path, 'r') as file:
+        for row in csv.reader(file):
+            if len(row) >= 5 and row[3] == "Value":
+                labels.setdefault(row[2], None)
+    return list(labels)
+
+
+def convert_csv(csv_path, out_path=None):
+    """Convert a long-format data_<ts>.csv session log; returns the output path."""
+    out_path = out_path or os.path.splitext(log_base(csv_path))[0] + ".frsb"
+    if os.path.exists(out_path):
+        os.remove(out_path)
+    extra = [label for label in _value_labels(csv_path) if label not in VALUE_LABELS]
+    writer = BinarySessionWriter(out_path, labels=VALUE_LABELS + extra, max_rows=4096)
+    current = None
+    values = []
+    timestamp = None
+
+    def emit():
+        frame, ticks = current
+        writer.write_record(ClassificationRecord(
+            int(frame) if frame.lstrip('-').isdigit() else None,
+            int(ticks) if ticks.lstrip('-').isdigit() else None,
+            values,
+        ), timestamp)
+
+    with open_log(csv_path, 'r') as file:
+        for row in csv.reader(file):
+            if len(row) < 6:
+                continue
+            key = (row[0], row[1])
+            if key != current:
+                if current is not None:
+                    emit()
+                current, values = key, []
+            timestamp = float(row[5])
+            if row[3] == "Value":
+                values.append((row[2], "Value", float(row[4]) if row[4] else None))
+    if current is not None:
+        emit()
+    writer.close()
+    return out_path
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        print(f"{path} -> {convert_csv(path)}")
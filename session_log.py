@@ -0,0 +1,189 @@
+import csv
+import gzip
+import io
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from emotion_window import EMOTIONS, LOG_COLUMNS, wide_frame_matrix
+
+# Suffixes of session log segments compressed by log_archive
+COMPRESSED_SUFFIXES = {".gz": "gzip", ".zst": "zstd"}
+
+
+def log_base(path):
+    """Path of the uncompressed segment: `path` without a .gz/.zst suffix."""
+    root, suffix = os.path.splitext(path)
+    return root if suffix in COMPRESSED_SUFFIXES else path
+
+
+def open_log(path, mode='rb', encoding='utf-8', newline=''):
+    """Open a segment for reading, compressed or not; mode 'r' gives text."""
+    method = COMPRESSED_SUFFIXES.get(os.path.splitext(path)[1])
+    if method == "gzip":
+        file = gzip.open(path, 'rb')
+    elif method == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compressed logs need the zstandard package")
+        file = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    else:
+        file = open(path, 'rb')
+    if 'b' in mode:
+        return file
+    return io.TextIOWrapper(file, encoding=encoding, newline=newline)
+
+
+def find_segment(path):
+    """`path` itself, or its compressed copy if the segment was compressed since."""
+    if os.path.exists(path):
+        return path
+    for suffix in COMPRESSED_SUFFIXES:
+        if os.path.exists(path + suffix):
+            return path + suffix
+    return path
+
+
+class _ByteRange:
+    """Bytes [start, end) of an open log, read like a file (end None: to the end)."""
+
+    def __init__(self, file, start=0, end=None):
+        if start:
+            file.seek(start)
+        self._file = file
+        self._remaining = None if end is None else max(0, end - start)
+
+    def read(self, size=-1):
+        if self._remaining is None:
+            return self._file.read(size)
+        size = self._remaining if size is None or size < 0 else min(size, self._remaining)
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+
+def _wide(df, emotions):
+    frame_ids, timestamps, matrix, valence, arousal = wide_frame_matrix(df, emotions)
+    return frame_ids.astype(np.int64), timestamps, matrix, valence, arousal
+
+
+def iter_csv_frames(csv_path, emotions=EMOTIONS, chunksize=200_000, start=0, end=None):
+    """
+    Stream a long-format session log (compressed or not), or its bytes
+    [start, end), in chunks of `chunksize` rows and yield the wide
+    per-frame arrays of each chunk. Rows of the last frame of a chunk are
+    held back and joined to the next chunk, so no frame is split.
+    """
+    carry = None
+    with open_log(csv_path) as file:
+        try:
+            reader = pd.read_csv(_ByteRange(file, start, end), header=None, names=LOG_COLUMNS,
+                                 chunksize=chunksize, dtype={'Feature': str, 'Attribute': str})
+            for chunk in reader:
+                chunk['Frame'] = pd.to_numeric(chunk['Frame'], errors='coerce')
+                chunk['Value'] = pd.to_numeric(chunk['Value'], errors='coerce')
+                chunk['Timestamp'] = pd.to_numeric(chunk['Timestamp'], errors='coerce')
+                chunk = chunk.dropna(subset=['Frame'])
+                if carry is not None:
+                    chunk = pd.concat([carry, chunk], ignore_index=True)
+                if chunk.empty:
+                    continue
+                last = chunk['Frame'].iloc[-1]
+                tail = chunk['Frame'] == last
+                carry = chunk[tail]
+                body = chunk[~tail]
+                if not body.empty:
+                    yield _wide(body, emotions)
+        except pd.errors.EmptyDataError:
+            return
+        if carry is not None and not carry.empty:
+            yield _wide(carry, emotions)
+
+
+class SessionLogWriter:
+    """
+    Session scoped CSV writer for classification rows.
+
+    The file stays open for the whole session. Rows are buffered in memory
+    and written out when `max_rows` rows are pending, when `flush_seconds`
+    have passed since the last flush, on `flush()` and on `close()`.
+    """
+
+    def __init__(self, csv_path, max_rows=2000, flush_seconds=1.0):
+        self.csv_path = csv_path
+        self.max_rows = max_rows
+        self.flush_seconds = flush_seconds
+        self._file = open(csv_path, mode='a', newline='', encoding='utf-8', buffering=1 << 16)
+        self._writer = csv.writer(self._file)
+        self._rows = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self.rows_written = 0
+        # Bytes on disk, updated on flush
+        self.size = self._file.tell()
+
+    @property
+    def closed(self):
+        return self._file is None
+
+    def write_record(self, record, timestamp_actual):
+        """Buffer the rows of one ClassificationRecord."""
+        frame = record.frame_number if record.frame_number is not None else "?"
+        ticks = record.frame_ticks if record.frame_ticks is not None else "?"
+        rows = [[frame, ticks, label, typ, "" if value is None else value, timestamp_actual]
+                for label, typ, value in record.values]
+        self.write_rows(rows)
+
+    def write_rows(self, rows):
+        with self._lock:
+            if self._file is None:
+                raise ValueError(f"Session log {self.csv_path} is closed")
+            self._rows.extend(rows)
+            if (len(self._rows) >= self.max_rows
+                    or time.monotonic() - self._last_flush >= self.flush_seconds):
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self._rows:
+            self._writer.writerows(self._rows)
+            self.rows_written += len(self._rows)
+            self._rows.clear()
+        self._file.flush()
+        self.size = self._file.tell()
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        """Write every buffered row to disk."""
+        with self._lock:
+            if self._file is not None:
+                self._flush_locked()
+
+    def offset(self):
+        """Flush and return the byte offset where the next frame's rows will start."""
+        with self._lock:
+            if self._file is None:
+                return None
+            self._flush_locked()
+            return self._file.tell()
+
+    def close(self):
+        """Flush and close the file. Safe to call more than once."""
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush_locked()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+
+import aiohttp
+
+from async_connector import AsyncEmotionSender, AsyncFaceReaderConnector
+from emotion_outbox import EmotionOutbox
+from log_archive import SessionLogArchive
+from push_pipeline import PushPolicy
+
+
+def stations_from_config(config_data):
+    """
+    Station list from config.json. "STATIONS" is a list of
+    {"NAME", "HOST", "PORT", "PARTICIPANT"} entries; without it the single
+    HOST/PORT of the file is used as one station.
+    """
+    stations = config_data.get("STATIONS")
+    if not stations:
+        stations = [{"NAME": "station1", "HOST": config_data["HOST"], "PORT": config_data["PORT"]}]
+    return [
+        {
+            "NAME": station.get("NAME") or f"station{i + 1}",
+            "HOST": station["HOST"],
+            "PORT": station["PORT"],
+            "PARTICIPANT": station.get("PARTICIPANT"),
+        }
+        for i, station in enumerate(stations)
+    ]
+
+
+class StationSessionManager:
+    """
+    Runs the receive loops of several FaceReader stations concurrently on
+    one event loop, with one shared aiohttp pool and upload queue.
+
+    Every pushed record is tagged with its station and participant. Each
+    station runs in its own task: a connection error or a crash is recorded
+    in its status and the station reconnects after `reconnect_seconds`,
+    without touching the other stations.
+    """
+
+    def __init__(self, stations, server_url, log_dir='logs', reconnect_seconds=5, offset_send_seconds=1,
+                 upload_fps=None, wire_format="json", compression=None, log_archive=None):
+        self.stations = stations
+        self.server_url = server_url.strip().rstrip("/")
+        self.log_dir = log_dir
+        self.reconnect_seconds = reconnect_seconds
+        self.offset_send_seconds = offset_send_seconds
+        self.upload_fps = upload_fps
+        self.wire_format = wire_format
+        self.compression = compression
+        # Shared by every station, since they share the upload queue
+        self.push_policy = PushPolicy(initial_interval=offset_send_seconds)
+        # One rotation/compression worker and retention budget for the logs of every station
+        self.log_archive = log_archive or SessionLogArchive(log_dir)
+        self.http = None
+        self.sender = None
+        self.connectors = {}
+        self.status = {}
+        self.failures = {}
+        self._stopping = False
+        self._tasks = []
+
+    async def run(self):
+        """Run every station until stop() is called."""
+        self._stopping = False
+        self.http = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=20),
+            timeout=aiohttp.ClientTimeout(sock_connect=3.05, sock_read=10),
+        )
+        # Batches not delivered by the shared sender are kept and replayed from one outbox
+        os.makedirs(self.log_dir, exist_ok=True)
+        self.sender = AsyncEmotionSender(self.server_url + "/submit_emotion", lambda: self.http,
+                                         policy=self.push_policy, wire_format=self.wire_format,
+                                         compression=self.compression,
+                                         features_url=self.server_url + "/submit_features",
+                                         outbox=EmotionOutbox(os.path.join(self.log_dir, "outbox.sqlite3")))
+        self.sender.start()
+        try:
+            for station in self.stations:
+                name = station["NAME"]
+                self.connectors[name] = AsyncFaceReaderConnector(
+                    host=station["HOST"],
+                    port=station["PORT"],
+                    server_url=self.server_url,
+                    log_dir=os.path.join(self.log_dir, station.get("PARTICIPANT") or name),
+                    http=self.http,
+                    offset_send_seconds=self.offset_send_seconds,
+                    sender=self.sender,
+                    push_policy=self.push_policy,
+                    upload_fps=self.upload_fps,
+                    station_id=name,
+                    participant_id=station.get("PARTICIPANT"),
+                    log_archive=self.log_archive,
+                )
+                self.failures[name] = 0
+                self._tasks.append(asyncio.create_task(self._run_station(name)))
+            await asyncio.gather(*self._tasks)
+        finally:
+            await self.sender.stop()
+            self.sender.outbox.close()
+            await self.http.close()
+
+    async def _run_station(self, name):
+        connector = self.connectors[name]
+        while not self._stopping:
+            try:
+                self.status[name] = "connecting"
+                await connector.connect()
+                self.status[name] = "running"
+                await connector.start_session()
+                self.status[name] = "stopped"
+            except Exception as e:
+                self.failures[name] += 1
+                self.status[name] = f"failed: {e!r}"
+                print(f"[WARN] Station {name}: {e!r}")
+            finally:
+                try:
+                    await connector.disconnect()
+                except Exception:
+                    pass
+            if not self._stopping:
+                await asyncio.sleep(self.reconnect_seconds)
+
+    async def stop(self):
+        """Stop every running session."""
+        self._stopping = True
+        for name, connector in self.connectors.items():
+            if connector.log_enabled_global and connector.writer is not None:
+                try:
+                    await connector.stop_session()
+                except Exception as e:
+                    print(f"[WARN] Station {name}: {e!r}")
+
+    def stats(self):
+        """Per-station throughput and lag, plus the shared upload queue."""
+        now = time.monotonic()
+        wall_now = datetime.now().timestamp()
+        stations = {}
+        for name, connector in self.connectors.items():
+            session_stats = connector.session_stats
+            started = session_stats.get("started")
+            last_frame_time = session_stats.get("last_frame_time")
+            oldest = connector.emotion_window.oldest_timestamp()
+            stations[name] = {
+                "participant": connector.participant_id,
+                "status": self.status.get(name),
+                "failures": self.failures.get(name, 0),
+                "frames_received": session_stats["frames_received"],
+                "frames_dropped": session_stats["frames_dropped"],
+                "frames_decimated": connector.emotion_window.frames_decimated,
+                "fps": session_stats["frames_received"] / (now - started) if started and now > started else 0.0,
+                "idle_seconds": now - last_frame_time if last_frame_time else None,
+                "lag_seconds": wall_now - oldest if oldest is not None else 0.0,
+            }
+        return {"stations": stations, "upload": self.sender.stats() if self.sender else None,
+                "push_policy": self.push_policy.stats(), "log_archive": self.log_archive.stats()}
+
+
+async def main(config_data, report_seconds=5):
+    manager = StationSessionManager(stations_from_config(config_data), config_data["SERVER_URL"],
+                                    upload_fps=config_data.get("UPLOAD_FPS"),
+                                    wire_format=config_data.get("WIRE_FORMAT", "json"),
+                                    compression=config_data.get("COMPRESSION"),
+                                    log_archive=SessionLogArchive.from_config('logs', config_data))
+    runner = asyncio.create_task(manager.run())
+    try:
+        while not runner.done():
+            await asyncio.sleep(report_seconds)
+            print(json.dumps(manager.stats(), indent=1))
+    finally:
+        await manager.stop()
+        await runner
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main(json.load(open("config.json"))))
+    except KeyboardInterrupt:
+        print("Stations stopped by user.")
@@ -0,0 +1,169 @@
+"""
+Stimulus segments of a session log.
+
+While a session runs, every stimulus change is recorded as a segment with
+its start/end wall-clock time, first/last frame number and start/end
+offset in the log: a byte offset for data_<ts>.csv, a record index for
+.frsb. The segments are saved as <log>.stimuli.json next to the log (one
+index per log segment, see log_archive; offsets are in the uncompressed
+segment), so per-stimulus aggregates read only the rows of that stimulus:
+
+    python stimulus_index.py logs/alice/data_1718000000.0.csv
+"""
+import json
+import os
+import sys
+from itertools import chain
+
+import numpy as np
+
+from emotion_window import EMOTIONS, dominant_emotion_records
+from session_binary import BinarySessionReader
+from session_log import find_segment, iter_csv_frames, log_base
+
+
+class StimulusIndex:
+    """Ordered stimulus segments of one session log; an open segment has no end yet."""
+
+    def __init__(self, log_path, segments=None):
+        self.log_path = log_path
+        self.segments = segments or []
+
+    @property
+    def path(self):
+        return self.log_path + ".stimuli.json"
+
+    @property
+    def current(self):
+        """The open segment, or None."""
+        if self.segments and self.segments[-1]["end_time"] is None:
+            return self.segments[-1]
+        return None
+
+    def start(self, stimulus, timestamp, frame, offset):
+        """Close the open segment, if any, and open one for `stimulus` at the next frame."""
+        self.end(timestamp, frame - 1 if frame is not None else None, offset)
+        self.segments.append({
+            "stimulus": stimulus,
+            "start_time": timestamp,
+            "end_time": None,
+            "start_frame": frame,
+            "end_frame": None,
+            "start_offset": offset,
+            "end_offset": None,
+        })
+
+    def end(self, timestamp, frame, offset):
+        """Close the open segment after `frame` (the last frame it contains)."""
+        segment = self.current
+        if segment is not None:
+            segment.update(end_time=timestamp, end_frame=frame, end_offset=offset)
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({"log": os.path.basename(self.log_path), "segments": self.segments}, file, indent=1)
+        os.replace(tmp_path, self.path)
+
+    @classmethod
+    def load(cls, log_path):
+        """Index saved next to `log_path` (compressed or not), or None if there is none."""
+        try:
+            with open(log_base(log_path) + ".stimuli.json", encoding='utf-8') as file:
+                return cls(log_path, json.load(file)["segments"])
+        except FileNotFoundError:
+            return None
+
+
+def segment_summary(chunks, emotions=EMOTIONS):
+    """
+    Frame count, dominant emotion histogram and mean valence/arousal of one
+    segment, from its wide per-frame arrays (an iterable of chunks).
+    """
+    histogram = {emotion: 0 for emotion in emotions}
+    frames = 0
+    valence_sum = arousal_sum = 0.0
+    valence_n = arousal_n = 0
+    for frame_ids, timestamps, matrix, valence, arousal in chunks:
+        for record in dominant_emotion_records(frame_ids, timestamps, matrix, valence, arousal, emotions):
+            histogram[record['emotion']] += 1
+        frames += len(frame_ids)
+        valence_sum += float(np.nansum(valence))
+        valence_n += int(np.isfinite(valence).sum())
+        arousal_sum += float(np.nansum(arousal))
+        arousal_n += int(np.isfinite(arousal).sum())
+    return {
+        "frames": frames,
+        "dominant_emotions": histogram,
+        "mean_valence": valence_sum / valence_n if valence_n else None,
+        "mean_arousal": arousal_sum / arousal_n if arousal_n else None,
+    }
+
+
+def _segment_chunks(log_path, start, end, emotions, chunksize, readers):
+    """Wide per-frame arrays of frames [start, end) of one log segment; `readers` keeps the last binary reader."""
+    if not log_base(log_path).endswith(".frsb"):
+        return iter_csv_frames(log_path, emotions, chunksize, start, end)
+    if log_path not in readers:
+        readers.clear()
+        # A live binary log has nothing on disk until its first block is flushed
+        readers[log_path] = BinarySessionReader(log_path) if os.path.getsize(log_path) else None
+    reader = readers[log_path]
+    return reader.iter_frames(emotions, chunksize, start, end) if reader is not None else ()
+
+
+def stimulus_aggregates(log_path, emotions=EMOTIONS, index=None, chunksize=200_000):
+    """
+    Per-stimulus summaries of a session log, streamed in chunks from each
+    segment's offset. A log compressed since the index was written is found under its .gz/.zst name.
+    """
+    index = index or StimulusIndex.load(log_path)
+    log_path = find_segment(log_path)
+    if index is None or not os.path.exists(log_path):
+        return []
+    readers = {}
+    results = []
+    for segment in index.segments:
+        chunks = _segment_chunks(log_path, segment["start_offset"] or 0, segment["end_offset"], emotions,
+                                 chunksize, readers)
+        results.append({**segment, **segment_summary(chunks, emotions)})
+    return results
+
+
+def session_stimulus_aggregates(log_paths, emotions=EMOTIONS, chunksize=200_000):
+    """
+    Per-stimulus summaries of a session rotated into several log segments
+    (`log_paths`, in part order). A stimulus still running at a rotation
+    goes on in the index of the next segment; it is summarized once, over
+    both, and keeps the offsets of its first and last piece.
+    """
+    stimuli = []
+    for log_path in log_paths:
+        index = StimulusIndex.load(log_path)
+        log_path = find_segment(log_path)
+        if index is None or not os.path.exists(log_path):
+            continue
+        for number, segment in enumerate(index.segments):
+            piece = (log_path, segment["start_offset"] or 0, segment["end_offset"])
+            previous = stimuli[-1][0] if stimuli else None
+            if (number == 0 and previous is not None and previous["stimulus"] == segment["stimulus"]
+                    and previous["end_time"] == segment["start_time"]):
+                previous.update(end_time=segment["end_time"], end_frame=segment["end_frame"],
+                                end_offset=segment["end_offset"])
+                stimuli[-1][1].append(piece)
+            else:
+                stimuli.append((dict(segment), [piece]))
+    readers = {}
+    results = []
+    for segment, pieces in stimuli:
+        chunks = chain.from_iterable(_segment_chunks(path, start, end, emotions, chunksize, readers)
+                                     for path, start, end in pieces)
+        results.append({**segment, **segment_summary(chunks, emotions)})
+    return results
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        print(path)
+        for result in stimulus_aggregates(path):
+            print(json.dumps(result, indent=1))
@@ -5,62 +5,115 @@ from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.textinput import TextInput
 from FaceReaderConnector import FaceReaderConnector
+from log_archive import SessionLogArchive
 import json 
 import threading
 from kivy.uix.widget import Widget
 from kivy.uix.spinner import Spinner
+from kivy.clock import Clock
+from command_executor import CommandExecutor
+from emotion_plot import EmotionPlot
 
 class FaceReaderApp(App):
     
-    def __init__(self, FaceReaderCon: FaceReaderConnector, **kwargs):
+    def __init__(self, FaceReaderCon: FaceReaderConnector, plot_fps=10, **kwargs):
         super().__init__(**kwargs)
         self.FaceReaderCon = FaceReaderCon
+        self.plot_fps = plot_fps
         self.global_session = None
+        # Sockets and HTTP calls run here, results come back through Clock
+        self.commands = CommandExecutor()
+
+    def run_command(self, key, func, *args, done=None, error=None, timeout=15):
+        """Run a connector call off the UI thread and show its outcome in the log field."""
+        def on_done(result):
+            self.log_input.text = done(result) if done else f"{result}"
+
+        def on_error(e):
+            self.log_input.text = error(e) if error else f"{key} failed: {e!r}"
+
+        self.log_input.text = f"{key}..."
+        return self.commands.submit(func, *args, on_done=on_done, on_error=on_error, timeout=timeout, key=key)
+
+    def cancel_commands(self, instance):
+        self.commands.cancel_all()
+        self.log_input.text = "Pending commands cancelled"
+
+    def on_stop(self):
+        self.plot.stop()
+        self.commands.shutdown()
     
     
     ### CONNECTION SUITE
     def connect_to_face_reader(self, instance):
-        try:
-            self.FaceReaderCon.connect()
-            self.log_input.text = "Face Reader Connected Succesfully"
-            # self.FaceReaderCon.send_action_message("FaceReader_Start_Analyzing")
-        except Exception as e:
-            self.log_input.text = f"Error in connection, have you started the Face Reader Software? \n Error: {e}"        
+        self.run_command(
+            "connect", self.FaceReaderCon.connect, timeout=10,
+            done=lambda _: "Face Reader Connected Succesfully",
+            error=lambda e: f"Error in connection, have you started the Face Reader Software? \n Error: {e!r}",
+        )
 
-    def disconnect_from_face_reader(self, instance):
+    def _disconnect(self):
         self.FaceReaderCon.send_action_message("FaceReader_Stop_Analyzing")
         self.FaceReaderCon.disconnect()
 
+    def disconnect_from_face_reader(self, instance):
+        self.run_command("disconnect", self._disconnect, done=lambda _: "Face Reader Disconnected")
+
     def send_to_server(self, instance):
         # Implement the logic to send data to the server
         self.global_session = threading.Thread(target=self.FaceReaderCon.start_session)
         self.global_session.start()
         self.log_input.text = f"Start Sending LLAMA Server"        
 
+    def _stop_session(self):
+        self.FaceReaderCon.stop_session()
+        # The session thread pushes its last frames and disconnects before returning
+        if self.global_session is not None:
+            self.global_session.join()
+
     def stop_send_to_server(self, instance):
         # Implement the logic to stop sending data to the server
         if self.FaceReaderCon.sock:
-            self.FaceReaderCon.stop_session()
-            self.global_session.join()
-            self.log_input.text = f"Stop Sending LLAMA Server"        
+            self.run_command("stop", self._stop_session, timeout=30, done=lambda _: "Stop Sending LLAMA Server")
 
     def aggregate_emotions(self, instance):
-        response = self.FaceReaderCon.aggregate_emotions()
-        self.log_input.text = response
+        self.run_command("aggregate emotions", self.FaceReaderCon.aggregate_emotions)
+
+    def aggregate_emotions_local(self, instance):
+        # Computed from the frames received so far, no server round trip
+        self.log_input.text = self.FaceReaderCon.aggregate_emotions(local=True)
         
     def set_log_dir(self, instance):
-        self.FaceReaderCon.set_log_dir(f"{self.log_name.text}")
-        self.log_input.text = f"Name and surname set to: {self.log_name.text}"
+        name = f"{self.log_name.text}"
+        self.run_command("set user name", self.FaceReaderCon.set_log_dir, name,
+                         done=lambda _: f"Name and surname set to: {name}")
     
     def set_stimuli(self, instance):
-        response = self.FaceReaderCon.set_stimuli(f"{self.stimulus_spinner.text}")
-        self.log_input.text = response
+        self.run_command("set stimuli", self.FaceReaderCon.set_stimuli, f"{self.stimulus_spinner.text}")
     
     def restart_server(self, instance):
-        response = self.FaceReaderCon.restart_server()
-        self.log_input.text = f"{response}"
+        self.run_command("restart server", self.FaceReaderCon.restart_server)
         
     
+    def update_metrics(self, dt):
+        """Live per-stage readout next to the log panel."""
+        stats = self.FaceReaderCon.session_stats
+        lines = [f"frames: {stats.get('frames_received', 0)}  dropped: {stats.get('frames_dropped', 0)}"]
+        if self.FaceReaderCon.sender is not None:
+            sender = self.FaceReaderCon.sender.stats()
+            lines.append(f"queue: {sender['queue_depth']}  outbox: {sender['outbox_pending']}")
+        backpressure = self.FaceReaderCon.backpressure_stats()
+        lines.append(f"decimated: {backpressure['frames_decimated']}  "
+                     f"batches dropped: {backpressure['batches_dropped']}  "
+                     f"blocked: {backpressure['seconds_blocked']:.1f}s")
+        archive = self.FaceReaderCon.log_archive.stats()
+        if archive['segments_rotated'] or archive['segments_compressed'] or archive['files_deleted']:
+            lines.append(f"log segments rotated: {archive['segments_rotated']}  "
+                         f"compressed: {archive['segments_compressed']}  "
+                         f"expired files: {archive['files_deleted']}")
+        lines.append(self.FaceReaderCon.metrics.summary())
+        self.metrics_label.text = "\n".join(lines)
+
     def build(self):
         main_layout = BoxLayout(orientation = "vertical", spacing=2)
         title = Label(
@@ -115,7 +168,7 @@ class FaceReaderApp(App):
 
         grid_layout.add_widget(Button(text='Connect to Face Reader', on_press = self.connect_to_face_reader))
         grid_layout.add_widget(Button(text='Disconnect from Face Reader', on_press = self.disconnect_from_face_reader))
-        grid_layout.add_widget(Widget())
+        grid_layout.add_widget(Button(text='Aggregate Emotions (local)', on_press = self.aggregate_emotions_local))
 
         # Row 3: Send and Stop buttons
         grid_layout.add_widget(Button(text='Send to Server (video)', on_press = self.send_to_server))
@@ -132,7 +185,7 @@ class FaceReaderApp(App):
         # Row 4: Send and Stop buttons
         grid_layout2.add_widget(Button(text='Connect to Face Reader', on_press = self.connect_to_face_reader))
         grid_layout2.add_widget(Button(text='Disconnect from Face Reader', on_press = self.disconnect_from_face_reader))
-        grid_layout2.add_widget(Widget())
+        grid_layout2.add_widget(Button(text='Cancel pending commands', on_press = self.cancel_commands))
 
         grid_layout2.add_widget(Button(text='Send to Server (CHAT)', on_press = self.send_to_server))
         grid_layout2.add_widget(Button(text='Stop Sending to Server(CHAT)', on_press = self.stop_send_to_server))
@@ -144,10 +197,19 @@ class FaceReaderApp(App):
 
         main_layout.add_widget(grid_layout2)
 
+        # Live emotions, valence and arousal of the last frames
+        self.plot = EmotionPlot(self.FaceReaderCon.emotion_trace, max_fps=self.plot_fps)
+        main_layout.add_widget(self.plot)
+        main_layout.add_widget(self.plot.legend(font_size=12, size_hint_y=None, height=20))
+
         # Row 4: Log field spanning two columns using BoxLayout
         h_box_layout = BoxLayout(orientation='horizontal', spacing=10, size_hint_y=None, height=100)
         self.log_input = TextInput(hint_text='Logs will appear here...', multiline=True)
         h_box_layout.add_widget(self.log_input)
+        self.metrics_label = Label(text="", font_size=12, halign="left", valign="top")
+        self.metrics_label.bind(size=self.metrics_label.setter("text_size"))
+        h_box_layout.add_widget(self.metrics_label)
+        Clock.schedule_interval(self.update_metrics, 1)
         
        
 
@@ -162,6 +224,9 @@ if __name__ == '__main__':
         host=config_data["HOST"],
         port=config_data["PORT"],
         server_url = config_data["SERVER_URL"],
-        log_dir='logs'
+        log_dir='logs',
+        wire_format=config_data.get("WIRE_FORMAT", "json"),
+        compression=config_data.get("COMPRESSION"),
+        log_archive=SessionLogArchive.from_config('logs', config_data),
     )
-    FaceReaderApp(FaceReaderCon=connector).run()
\ No newline at end of file
+    FaceReaderApp(FaceReaderCon=connector, plot_fps=config_data.get("PLOT_FPS", 10)).run()
\ No newline at end of file